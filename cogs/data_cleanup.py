@@ -1,35 +1,163 @@
 import discord
-from discord.ext import commands
-import aiosqlite
+from discord.ext import commands, tasks
+from discord import app_commands
+import asyncio
+import datetime
+import json
 import os
-from utils import load_data, save_data, PROFILE_FILE
+from services.archive import Archiver
+from services.export import export_table, EXPORT_TABLES, EXPORT_FORMATS
 
-DB_NAME = 'school_data.db'
+# --- ⚙️ การตั้งค่า ---
+PURGE_BATCH_WINDOW = 2.0 # วินาที: รวมคนที่ออกติด ๆ กัน (raid/prune) เป็นชุดเดียว
+PURGE_BATCH_SIZE = 500   # จำนวน user สูงสุดต่อ transaction
+ARCHIVE_INTERVAL_HOURS = 24 * 7
+MAINTENANCE_ROLES = ["Empress of TRA"]
+EXPORT_ROLES = ["Empress of TRA", "Commerce Handler", "Vault Keeper"]
+
+# ตาราง -> คอลัมน์ที่เก็บ user_id (ข้อมูลผู้ใช้ทั้งหมดที่ต้องลบเมื่อออกจากเซิร์ฟเวอร์)
+PURGE_TABLES = {
+    'royals': ('user_id',),
+    'transactions': ('source_id', 'target_id'),
+    'inventory': ('user_id',),
+    'sales_history': ('user_id',),
+    'rp_rewards': ('user_id',),
+    'rp_stats': ('user_id',),
+    'activity_logs': ('user_id',),
+    'activity_quota': ('user_id',),
+    'student_profiles': ('user_id',),
+    'applications': ('user_id',),
+    'user_data': ('user_id',),
+    'thread_provisioning': ('user_id',),
+    # ยอดสรุปรายเดือนจาก Archiver (rp_rewards_monthly ถูกใช้ตอน /rp_stats_rebuild ด้วย)
+    'transactions_monthly': ('user_id',),
+    'sales_monthly': ('user_id',),
+    'rp_rewards_monthly': ('user_id',),
+    'activity_monthly': ('user_id',),
+}
+# ตารางที่ใช้หาว่ามีข้อมูลของใครค้างอยู่บ้าง (ตอน reconcile)
+RECONCILE_TABLES = ('royals', 'inventory', 'rp_stats', 'activity_quota', 'student_profiles', 'user_data')
 
 class DataCleanup(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.db_path = os.path.join(os.getcwd(), DB_NAME)
+        self.db = bot.db
+        self._pending = set()
+        self._wakeup = asyncio.Event()
+        self._worker = None
+        self._reconciler = None
+        self.archiver = Archiver(self.db)
+
+    async def cog_load(self):
+        self._worker = asyncio.create_task(self._purge_worker())
+        self._reconciler = asyncio.create_task(self._reconcile())
+        self.archive_loop.start()
+
+    async def cog_unload(self):
+        for task in (self._worker, self._reconciler):
+            if task: task.cancel()
+        self.archive_loop.cancel()
 
     @commands.Cog.listener()
     async def on_member_remove(self, member):
-        uid = member.id
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute("DELETE FROM royals WHERE user_id=?", (uid,))
-            await db.execute("DELETE FROM transactions WHERE source_id=? OR target_id=?", (uid, uid))
-            await db.execute("DELETE FROM inventory WHERE user_id=?", (uid,))
-            await db.execute("DELETE FROM sales_history WHERE user_id=?", (uid,))
-            await db.execute("DELETE FROM rp_rewards WHERE user_id=?", (uid,))
-            await db.execute("DELETE FROM activity_logs WHERE user_id=?", (uid,))
-            await db.execute("DELETE FROM club_members WHERE user_id=?", (uid,))
-            # Handle club owner deletion logic if needed
-            await db.commit()
-        
-        profiles = load_data(PROFILE_FILE)
-        if str(uid) in profiles:
-            del profiles[str(uid)]
-            await save_data(profiles, PROFILE_FILE)
+        self.queue_purge([member.id])
+
+    @commands.Cog.listener()
+    async def on_member_join(self, member):
+        # กลับเข้ามาก่อนถึงรอบลบ ไม่ต้องลบ
+        self._pending.discard(member.id)
+
+    def queue_purge(self, user_ids):
+        self._pending.update(user_ids)
+        self._wakeup.set()
+
+    async def _purge_worker(self):
+        while True:
+            await self._wakeup.wait()
+            await asyncio.sleep(PURGE_BATCH_WINDOW)
+            self._wakeup.clear()
+            while self._pending:
+                batch = [self._pending.pop() for _ in range(min(PURGE_BATCH_SIZE, len(self._pending)))]
+                try: await self.purge(batch)
+                except Exception as e: print(f"⚠️ Purge failed ({len(batch)} users): {e}")
+
+    async def purge(self, user_ids):
+        """ลบข้อมูลของ user ทั้งชุดใน transaction เดียว"""
+        ids = json.dumps(list(user_ids))
+        async def purge(db):
+            for table, columns in PURGE_TABLES.items():
+                where = " OR ".join(f"{col} IN (SELECT value FROM json_each(?))" for col in columns)
+                await db.execute(f"DELETE FROM {table} WHERE {where}", (ids,) * len(columns))
+        await self.db.write(purge)
+
+        for uid in user_ids:
+            self.bot.ledger.forget(uid)
+            self.bot.item_index.invalidate(uid)
+            self.bot.threads.invalidate(uid)
+
+    async def _reconcile(self):
+        """ตอนบอทเริ่ม: ลบข้อมูลของคนที่ออกไปตอนบอทออฟไลน์"""
+        await self.bot.wait_until_ready()
+        # ต้องมีรายชื่อสมาชิกครบทุกเซิร์ฟเวอร์ ไม่อย่างนั้นจะลบคนที่ยังอยู่
+        if not self.bot.guilds or not all(g.chunked for g in self.bot.guilds): return
+
+        members = {m.id for g in self.bot.guilds for m in g.members}
+        union = " UNION ".join(f"SELECT user_id FROM {table}" for table in RECONCILE_TABLES)
+        rows = await self.db.fetchall(union)
+        stale = [r[0] for r in rows if r[0] and r[0] not in members]
+        if stale:
+            print(f"🧹 Reconcile: purging {len(stale)} departed members")
+            self.queue_purge(stale)
+
+    # --- 🗄️ Archive ---
+    @tasks.loop(hours=ARCHIVE_INTERVAL_HOURS)
+    async def archive_loop(self):
+        try:
+            report = await self.archiver.run()
+            print(f"🗄️ Archived {sum(report['moved'].values())} rows, reclaimed {report['reclaimed'] // 1024} KB")
+        except Exception as e: print(f"⚠️ Archive failed: {e}")
+
+    @archive_loop.before_loop
+    async def before_archive(self):
+        await self.bot.wait_until_ready()
+
+    @app_commands.command(name="db_archive", description="[ADMIN] ย้ายประวัติเก่าไปเป็นยอดสรุปรายเดือนและคืนพื้นที่ไฟล์")
+    async def db_archive(self, interaction: discord.Interaction):
+        if not any(r.name in MAINTENANCE_ROLES for r in interaction.user.roles):
+            return await interaction.response.send_message("❌ ไม่มีสิทธิ์", ephemeral=True)
+
+        await interaction.response.defer(ephemeral=True)
+        report = await self.archiver.run()
+        embed = discord.Embed(title="🗄️ Archive เสร็จแล้ว", color=discord.Color.green())
+        embed.add_field(name="ย้ายแถว", value="\n".join(f"`{t}`: {n:,}" for t, n in report['moved'].items()), inline=False)
+        embed.add_field(name="ขนาดไฟล์", value=f"{report['before'] / 1048576:.2f} MB → {report['after'] / 1048576:.2f} MB")
+        embed.add_field(name="คืนพื้นที่", value=f"{report['reclaimed'] / 1048576:.2f} MB")
+        await interaction.followup.send(embed=embed, ephemeral=True)
+
+    # --- 📤 Export ---
+    @app_commands.command(name="export_data", description="[STAFF] ส่งออกข้อมูลช่วงวันที่เป็นไฟล์ .gz (วันที่แบบ YYYY-MM-DD)")
+    @app_commands.choices(table=[app_commands.Choice(name=t, value=t) for t in EXPORT_TABLES],
+                          fmt=[app_commands.Choice(name=f, value=f) for f in EXPORT_FORMATS])
+    async def export_data(self, interaction: discord.Interaction, table: app_commands.Choice[str], start: str, end: str, fmt: app_commands.Choice[str] = None):
+        if not any(r.name in EXPORT_ROLES for r in interaction.user.roles):
+            return await interaction.response.send_message("❌ ไม่มีสิทธิ์", ephemeral=True)
+        try:
+            start_date, end_date = datetime.date.fromisoformat(start), datetime.date.fromisoformat(end)
+        except ValueError:
+            return await interaction.response.send_message("❌ รูปแบบวันที่ต้องเป็น YYYY-MM-DD", ephemeral=True)
+        if start_date > end_date: return await interaction.response.send_message("❌ วันเริ่มต้องไม่เกินวันสิ้นสุด", ephemeral=True)
+
+        await interaction.response.defer(ephemeral=True)
+        fmt = fmt.value if fmt else 'csv'
+        path, count = await export_table(self.db.path, table.value, fmt, start_date, end_date)
+        try:
+            size = os.path.getsize(path)
+            if size > interaction.guild.filesize_limit:
+                return await interaction.followup.send(f"❌ ไฟล์ใหญ่เกินที่ Discord รับได้ ({size / 1048576:.1f} MB) ลองลดช่วงวันที่", ephemeral=True)
+            filename = f"{table.value}_{start_date}_{end_date}.{fmt}.gz"
+            await interaction.followup.send(f"📤 `{table.value}` {start_date} → {end_date}: {count:,} แถว", file=discord.File(path, filename=filename), ephemeral=True)
+        finally:
+            os.remove(path)
 
 async def setup(bot):
     await bot.add_cog(DataCleanup(bot))
-
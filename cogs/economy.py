@@ -1,56 +1,54 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
-import aiosqlite
 import datetime
-import os
-from utils import load_data, PROFILE_FILE 
+import re
+from services.ledger import SYSTEM_ID
 
 CURRENCY_SYMBOL = "R"
-DB_NAME = 'school_data.db' 
 STAFF_ROLE_GRANT_ACCESS = ["Empress of TRA", "Vault Keeper"]
 STAFF_ROLE_SUPREME_ACCESS = "Empress of TRA" 
+STATEMENT_PAGE_SIZE = 10
+USER_ID_PATTERN = re.compile(r"\d{15,20}") # ดึง user id จากไฟล์ที่อัปโหลด (คั่นด้วยอะไรก็ได้)
+
+# ตัวกรอง /statement -> type ที่ตรงกันแบบเป๊ะ (None = ทุก type)
+# ตัวกรองแบบกลุ่มต้องระบุทุก type ในกลุ่ม (เพิ่ม type ใหม่ที่ขึ้นต้นด้วย LUCK_/TEA_PARTY ต้องมาเพิ่มที่นี่)
+STATEMENT_FILTERS = {
+    'ALL': None,
+    'GRANT': ('GRANT',),
+    'TRANSFER': ('TRANSFER',),
+    'TAKE': ('TAKE',),
+    'LUCK': ('LUCK_WISH_TOSS', 'LUCK_WISH_GRANT', 'LUCK_BREW_COST', 'LUCK_BREW_SOLD'),
+    'TEA_PARTY': ('TEA_PARTY', 'TEA_PARTY_HOST'),
+}
+FILTER_CHOICES = [app_commands.Choice(name=k, value=k) for k in STATEMENT_FILTERS]
+# รายการที่ staff หักเงิน: source = staff ผู้สั่ง, target = คนที่ถูกหัก (เงินออกจาก target)
+OUTFLOW_TYPES = ('TAKE', 'WIPE')
+
+def _statement_sql(types, newer: bool) -> str:
+    """Keyset pagination: UNION ของ range scan ที่มี LIMIT ทีละฝั่ง (source/target) ทีละ type
+    ใช้ index (source_id, rowid) / (target_id, rowid) หรือ (source_id, type, rowid) / (target_id, type, rowid)
+    แต่ละ scan อ่านไม่เกิน limit แถว ไม่ว่าจะเลื่อนลึกแค่ไหนหรือ type นั้นจะมีน้อยแค่ไหน
+    """
+    op, order = ('>', 'ASC') if newer else ('<', 'DESC')
+    filters = [f" AND type = :t{i}" for i in range(len(types))] if types else [""]
+    scans = [f"SELECT * FROM (SELECT * FROM transactions WHERE {col} = :uid{f} AND id {op} :cursor ORDER BY id {order} LIMIT :limit)"
+             for col in ('source_id', 'target_id') for f in filters]
+    return f"SELECT id, timestamp, type, source_id, target_id, amount FROM ({' UNION '.join(scans)}) ORDER BY id {order} LIMIT :limit"
+
+STATEMENT_OLDER = {k: _statement_sql(types, newer=False) for k, types in STATEMENT_FILTERS.items()}
+STATEMENT_NEWER = {k: _statement_sql(types, newer=True) for k, types in STATEMENT_FILTERS.items()}
 
 class Economy(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.db_path = os.path.join(os.getcwd(), DB_NAME) 
-
-    async def cog_load(self):
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute("CREATE TABLE IF NOT EXISTS royals (user_id INTEGER PRIMARY KEY, balance INTEGER DEFAULT 0)")
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS transactions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    timestamp TEXT NOT NULL,
-                    type TEXT NOT NULL,          
-                    source_id INTEGER NOT NULL,  
-                    target_id INTEGER NOT NULL,  
-                    amount INTEGER NOT NULL
-                )
-            """)
-            await db.commit()
-
-    async def _record_transaction(self, tx_type, sid, tid, amt):
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute("INSERT INTO transactions (timestamp, type, source_id, target_id, amount) VALUES (?,?,?,?,?)", 
-                             (datetime.datetime.now().isoformat(), tx_type, sid, tid, amt))
-            await db.commit()
+        self.db = bot.db
+        self.ledger = bot.ledger
 
     async def _notify(self, member, title, desc, color):
         embed = discord.Embed(title=title, description=desc, color=color, timestamp=datetime.datetime.now())
-        sent = False
-        try:
-            p = load_data(PROFILE_FILE)
-            wid = p.get(str(member.id), {}).get('wallet_thread_id')
-            if wid:
-                ch = self.bot.get_channel(int(wid))
-                if ch: await ch.send(embed=embed); sent = True
-        except: pass
-        
-        if not sent:
-            try: await member.send(embed=embed)
-            except: pass
+        # ส่งผ่าน outbox (เธรด Wallet ก่อน ถ้าไม่มีค่อย DM)
+        await self.bot.outbox.enqueue(member, embed, dm_fallback=True)
 
     @app_commands.command(name="balance")
     async def balance(self, interaction: discord.Interaction, member: discord.Member = None):
@@ -58,10 +56,7 @@ class Economy(commands.Cog):
         if member and not is_admin: return await interaction.response.send_message("❌ ไม่มีสิทธิ์ดูของคนอื่น", ephemeral=True)
         target = member or interaction.user
         
-        async with aiosqlite.connect(self.db_path) as db:
-            async with db.execute("SELECT balance FROM royals WHERE user_id=?", (target.id,)) as c:
-                res = await c.fetchone()
-                bal = res[0] if res else 0
+        bal = await self.ledger.balance(target.id)
         
         await interaction.response.send_message(embed=discord.Embed(description=f"💰 ยอดเงินของ **{target.display_name}**: `{bal:,} {CURRENCY_SYMBOL}`", color=discord.Color.gold()), ephemeral=True)
 
@@ -70,12 +65,7 @@ class Economy(commands.Cog):
         await interaction.response.defer(ephemeral=True)
         if not any(r.name in STAFF_ROLE_GRANT_ACCESS for r in interaction.user.roles): return await interaction.followup.send("❌ ไม่มีสิทธิ์", ephemeral=True)
         
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute("INSERT INTO royals (user_id, balance) VALUES (?, ?) ON CONFLICT(user_id) DO UPDATE SET balance=balance+?", (member.id, amount, amount))
-            await db.commit()
-            async with db.execute("SELECT balance FROM royals WHERE user_id=?", (member.id,)) as c: new_bal = (await c.fetchone())[0]
-
-        await self._record_transaction('GRANT', interaction.user.id, member.id, amount)
+        new_bal = await self.ledger.credit(member.id, amount, 'GRANT', source_id=interaction.user.id)
         await self._notify(member, "✨ ได้รับ Royal Grant", f"Admin มอบ **{amount:,} R**\nคงเหลือ: `{new_bal:,} R`", discord.Color.green())
         await interaction.followup.send(f"✅ มอบ {amount} R ให้ {member.mention} แล้ว", ephemeral=False)
 
@@ -84,21 +74,10 @@ class Economy(commands.Cog):
         await interaction.response.defer(ephemeral=True)
         if amount <= 0 or interaction.user.id == member.id: return await interaction.followup.send("❌ ทำรายการไม่ได้", ephemeral=True)
 
-        async with aiosqlite.connect(self.db_path) as db:
-            async with db.execute("SELECT balance FROM royals WHERE user_id=?", (interaction.user.id,)) as c:
-                res = await c.fetchone()
-                bal = res[0] if res else 0
-            
-            if bal < amount: return await interaction.followup.send("❌ เงินไม่พอ", ephemeral=True)
-            
-            await db.execute("UPDATE royals SET balance=balance-? WHERE user_id=?", (amount, interaction.user.id))
-            await db.execute("INSERT INTO royals (user_id, balance) VALUES (?, ?) ON CONFLICT(user_id) DO UPDATE SET balance=balance+?", (member.id, amount, amount))
-            await db.commit()
-            
-            async with db.execute("SELECT balance FROM royals WHERE user_id=?", (interaction.user.id,)) as c: new_sender = (await c.fetchone())[0]
-            async with db.execute("SELECT balance FROM royals WHERE user_id=?", (member.id,)) as c: new_rec = (await c.fetchone())[0]
-
-        await self._record_transaction('TRANSFER', interaction.user.id, member.id, amount)
+        result = await self.ledger.transfer(interaction.user.id, member.id, amount)
+        if not result: return await interaction.followup.send("❌ เงินไม่พอ", ephemeral=True)
+        new_sender, new_rec = result
+
         await self._notify(member, "💸 ได้รับโอนเงิน", f"ได้รับ **{amount:,} R** จาก {interaction.user.display_name}\nคงเหลือ: `{new_rec:,} R`", discord.Color.gold())
         await interaction.followup.send(f"💸 โอน {amount} R ให้ {member.mention} แล้ว\nคงเหลือ: `{new_sender:,} R`", ephemeral=True)
 
@@ -107,16 +86,9 @@ class Economy(commands.Cog):
         await interaction.response.defer(ephemeral=True)
         if not any(r.name in STAFF_ROLE_GRANT_ACCESS for r in interaction.user.roles): return await interaction.followup.send("❌ ไม่มีสิทธิ์", ephemeral=True)
 
-        async with aiosqlite.connect(self.db_path) as db:
-            async with db.execute("SELECT balance FROM royals WHERE user_id=?", (member.id,)) as c:
-                res = await c.fetchone()
-                if not res or res[0] < amount: return await interaction.followup.send("❌ เงินเป้าหมายไม่พอให้หัก", ephemeral=True)
-            
-            await db.execute("UPDATE royals SET balance=balance-? WHERE user_id=?", (amount, member.id))
-            await db.commit()
-            async with db.execute("SELECT balance FROM royals WHERE user_id=?", (member.id,)) as c: new_bal = (await c.fetchone())[0]
+        new_bal = await self.ledger.debit(member.id, amount, 'TAKE', source_id=interaction.user.id, target_id=member.id)
+        if new_bal is None: return await interaction.followup.send("❌ เงินเป้าหมายไม่พอให้หัก", ephemeral=True)
 
-        await self._record_transaction('TAKE', interaction.user.id, member.id, amount)
         await self._notify(member, "🚨 เงินถูกหัก", f"ถูกหัก **{amount:,} R**\nคงเหลือ: `{new_bal:,} R`", discord.Color.red())
         await interaction.followup.send(f"✅ หักเงิน {member.mention} เรียบร้อย", ephemeral=False)
 
@@ -125,13 +97,129 @@ class Economy(commands.Cog):
         await interaction.response.defer(ephemeral=True)
         if not any(r.name == STAFF_ROLE_SUPREME_ACCESS for r in interaction.user.roles): return await interaction.followup.send("❌ ไม่มีสิทธิ์", ephemeral=True)
 
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute("UPDATE royals SET balance=0 WHERE user_id=?", (member.id,))
-            await db.commit()
+        await self.ledger.reset(member.id, 'WIPE', source_id=interaction.user.id)
         
-        await self._record_transaction('WIPE', interaction.user.id, member.id, 0)
         await self._notify(member, "💥 บัญชีถูกรีเซ็ต", "ยอดเงินของคุณถูกรีเซ็ตเป็น 0", discord.Color.dark_red())
         await interaction.followup.send(f"✅ รีเซ็ตบัญชี {member.mention} แล้ว", ephemeral=False)
 
+    @app_commands.command(name="bulk_royals", description="[STAFF] มอบ/หักเงินทั้งยศ หรือตามไฟล์รายชื่อ user id")
+    @app_commands.choices(action=[app_commands.Choice(name="grant", value="grant"), app_commands.Choice(name="take", value="take")])
+    async def bulk_royals(self, interaction: discord.Interaction, action: app_commands.Choice[str], amount: int, role: discord.Role = None, ids_file: discord.Attachment = None):
+        await interaction.response.defer(ephemeral=True)
+        if not any(r.name in STAFF_ROLE_GRANT_ACCESS for r in interaction.user.roles): return await interaction.followup.send("❌ ไม่มีสิทธิ์", ephemeral=True)
+        if amount <= 0 or (role is None and ids_file is None): return await interaction.followup.send("❌ ต้องระบุจำนวนเงิน และยศหรือไฟล์รายชื่อ", ephemeral=True)
+
+        # 1. รวบรวมรายชื่อ
+        await interaction.edit_original_response(content="⏳ กำลังรวบรวมรายชื่อ...")
+        members = {m.id: m for m in role.members if not m.bot} if role else {}
+        unknown = 0
+        if ids_file:
+            text = (await ids_file.read()).decode('utf-8', errors='ignore')
+            for uid in {int(x) for x in USER_ID_PATTERN.findall(text)}:
+                member = interaction.guild.get_member(uid)
+                if member and not member.bot: members[uid] = member
+                else: unknown += 1
+        if not members: return await interaction.edit_original_response(content="❌ ไม่พบสมาชิกที่จะทำรายการ")
+
+        # 2. เขียนทั้งหมดใน transaction เดียว
+        await interaction.edit_original_response(content=f"⏳ กำลังทำรายการ {len(members):,} คน...")
+        payouts = [(uid, amount) for uid in members]
+        if action.value == "grant":
+            balances, short = await self.ledger.credit_many(payouts, 'GRANT', source_id=interaction.user.id), []
+        else:
+            balances, short = await self.ledger.debit_many(payouts, 'TAKE', source_id=interaction.user.id, target_id=None)
+
+        # 3. ใบเสร็จเข้าคิว outbox (ส่งเบื้องหลัง)
+        await interaction.edit_original_response(content=f"⏳ กำลังส่งใบเสร็จ {len(balances):,} ใบเข้าคิว...")
+        if action.value == "grant":
+            title, desc, color = "✨ ได้รับ Royal Grant", "Admin มอบ **{amount:,} R**\nคงเหลือ: `{bal:,} R`", discord.Color.green()
+        else:
+            title, desc, color = "🚨 เงินถูกหัก", "ถูกหัก **{amount:,} R**\nคงเหลือ: `{bal:,} R`", discord.Color.red()
+        now = datetime.datetime.now()
+        receipts = [(members[uid], discord.Embed(title=title, description=desc.format(amount=amount, bal=bal), color=color, timestamp=now)) for uid, bal in balances.items()]
+        await self.bot.outbox.enqueue_many(receipts, dm_fallback=True)
+
+        verb = "มอบ" if action.value == "grant" else "หัก"
+        summary = f"✅ {verb} {amount:,} R ให้ {len(balances):,} คนแล้ว"
+        if short: summary += f"\n⚠️ เงินไม่พอให้หัก {len(short):,} คน"
+        if unknown: summary += f"\n⚠️ ไม่พบในเซิร์ฟเวอร์ {unknown:,} id"
+        await interaction.edit_original_response(content=summary)
+
+    @app_commands.command(name="statement", description="ดูประวัติการเงินของคุณ")
+    @app_commands.choices(category=FILTER_CHOICES)
+    async def statement(self, interaction: discord.Interaction, category: app_commands.Choice[str] = None):
+        view = StatementView(self.db, interaction.user, interaction.user.id, category.value if category else 'ALL')
+        await interaction.response.send_message(embed=await view.load(), view=view, ephemeral=True)
+
+    @app_commands.command(name="statement_of", description="[STAFF] ดูประวัติการเงินของสมาชิก")
+    @app_commands.choices(category=FILTER_CHOICES)
+    async def statement_of(self, interaction: discord.Interaction, member: discord.Member, category: app_commands.Choice[str] = None):
+        if not any(r.name in STAFF_ROLE_GRANT_ACCESS for r in interaction.user.roles): return await interaction.response.send_message("❌ ไม่มีสิทธิ์", ephemeral=True)
+        view = StatementView(self.db, member, interaction.user.id, category.value if category else 'ALL')
+        await interaction.response.send_message(embed=await view.load(), view=view, ephemeral=True)
+
+class StatementView(discord.ui.View):
+    """เลื่อนหน้า statement ด้วย id ของแถวแรก/สุดท้ายในหน้า (ไม่ใช้ OFFSET)"""
+
+    def __init__(self, db, member, viewer_id: int, tx_filter: str):
+        super().__init__(timeout=300)
+        self.db = db
+        self.member = member
+        self.viewer_id = viewer_id
+        self.tx_filter = tx_filter
+        self.rows = []
+        self.has_older = self.has_newer = False
+
+    async def _fetch(self, queries: dict, cursor: int):
+        params = {'uid': self.member.id, 'cursor': cursor, 'limit': STATEMENT_PAGE_SIZE + 1}
+        params.update((f"t{i}", t) for i, t in enumerate(STATEMENT_FILTERS[self.tx_filter] or ()))
+        return await self.db.fetchall(queries[self.tx_filter], params)
+
+    async def load(self, older_than: int = None, newer_than: int = None):
+        if newer_than is not None:
+            rows = await self._fetch(STATEMENT_NEWER, newer_than)
+            self.has_newer = len(rows) > STATEMENT_PAGE_SIZE
+            if not self.has_newer: return await self.load() # ถึงหน้าแรกแล้ว แสดงหน้าเต็ม
+            self.rows = list(reversed(rows[:STATEMENT_PAGE_SIZE]))
+            self.has_older = True
+        else:
+            rows = await self._fetch(STATEMENT_OLDER, older_than if older_than is not None else 2**63 - 1)
+            self.has_older = len(rows) > STATEMENT_PAGE_SIZE
+            self.rows = rows[:STATEMENT_PAGE_SIZE]
+            self.has_newer = older_than is not None
+        self.newer.disabled = not self.has_newer
+        self.older.disabled = not self.has_older
+        return self.render()
+
+    def render(self):
+        lines = []
+        for tx_id, ts, tx_type, source_id, target_id, amount in self.rows:
+            dt = datetime.datetime.fromisoformat(ts).strftime("%d/%m/%y %H:%M")
+            if tx_type in OUTFLOW_TYPES and target_id == self.member.id:
+                incoming, other, via = False, source_id, 'โดย'
+            else:
+                incoming = target_id == self.member.id
+                other, via = (source_id, 'จาก') if incoming else (target_id, 'ถึง')
+            who = "ระบบ" if other == SYSTEM_ID else f"<@{other}>"
+            change = "🔴 รีเซ็ตเป็น 0" if tx_type == 'WIPE' else f"{'🟢 +' if incoming else '🔴 -'}{amount:,} {CURRENCY_SYMBOL}"
+            lines.append(f"`{dt}` **{tx_type}** {change} ({via} {who})")
+
+        embed = discord.Embed(title=f"📒 Statement: {self.member.display_name}", description="\n".join(lines) or "ไม่มีรายการ", color=discord.Color.gold())
+        embed.set_footer(text=f"ตัวกรอง: {self.tx_filter}")
+        return embed
+
+    async def interaction_check(self, interaction):
+        return interaction.user.id == self.viewer_id
+
+    @discord.ui.button(label="◀ ใหม่กว่า", style=discord.ButtonStyle.secondary)
+    async def newer(self, interaction: discord.Interaction, button: discord.ui.Button):
+        embed = await self.load(newer_than=self.rows[0]['id']) if self.rows else await self.load()
+        await interaction.response.edit_message(embed=embed, view=self)
+
+    @discord.ui.button(label="เก่ากว่า ▶", style=discord.ButtonStyle.secondary)
+    async def older(self, interaction: discord.Interaction, button: discord.ui.Button):
+        embed = await self.load(older_than=self.rows[-1]['id']) if self.rows else await self.load()
+        await interaction.response.edit_message(embed=embed, view=self)
+
 async def setup(bot):
     await bot.add_cog(Economy(bot))
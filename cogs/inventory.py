@@ -1,32 +1,26 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
-import aiosqlite
-import os
 from utils import load_data, PROFILE_FILE
 
-DB_NAME = 'school_data.db'
 CURRENCY_SYMBOL = "R"
 
 class Inventory(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.db_path = os.path.join(os.getcwd(), DB_NAME)
+        self.db = bot.db
+        self.item_index = bot.item_index
 
     async def _get_user_inventory(self, uid):
-        async with aiosqlite.connect(self.db_path) as db:
-            async with db.execute("""
-                SELECT i.item_name, i.amount, s.description, s.image_url 
-                FROM inventory i JOIN shop_items s ON i.item_name = s.name 
-                WHERE i.user_id = ?
-            """, (uid,)) as c:
-                return await c.fetchall()
+        return await self.db.fetchall("""
+            SELECT i.item_name, i.amount, s.description, s.image_url 
+            FROM inventory i JOIN shop_items s ON i.item_name = s.name 
+            WHERE i.user_id = ?
+        """, (uid,))
 
     async def item_autocomplete(self, interaction, current: str):
-        async with aiosqlite.connect(self.db_path) as db:
-            async with db.execute("SELECT item_name FROM inventory WHERE user_id=? AND item_name LIKE ? LIMIT 25", (interaction.user.id, f"%{current}%")) as c:
-                items = await c.fetchall()
-        return [app_commands.Choice(name=i[0], value=i[0]) for i in items]
+        items = await self.item_index.search(interaction.user.id, current)
+        return [app_commands.Choice(name=i, value=i) for i in items]
 
     @app_commands.command(name="inventory")
     async def inventory(self, interaction):
@@ -43,9 +37,7 @@ class Inventory(commands.Cog):
     @app_commands.command(name="display_item")
     @app_commands.autocomplete(item_name=item_autocomplete)
     async def display(self, interaction, item_name: str):
-        async with aiosqlite.connect(self.db_path) as db:
-            async with db.execute("SELECT s.image_url FROM inventory i JOIN shop_items s ON i.item_name=s.name WHERE i.user_id=? AND i.item_name=?", (interaction.user.id, item_name)) as c:
-                res = await c.fetchone()
+        res = await self.db.fetchone("SELECT s.image_url FROM inventory i JOIN shop_items s ON i.item_name=s.name WHERE i.user_id=? AND i.item_name=?", (interaction.user.id, item_name))
         
         if not res: return await interaction.response.send_message("❌ ไม่มีไอเทมนี้", ephemeral=True)
         
@@ -57,31 +49,30 @@ class Inventory(commands.Cog):
         msg = await interaction.response.send_message(embed=embed)
         
         # Log display
-        async with aiosqlite.connect(self.db_path) as db:
-            msg_obj = await interaction.original_response()
-            await db.execute("INSERT INTO active_displays (item_name, channel_id, message_id) VALUES (?,?,?)", (item_name, interaction.channel.id, msg_obj.id))
-            await db.commit()
+        msg_obj = await interaction.original_response()
+        await self.db.execute("INSERT INTO active_displays (item_name, channel_id, message_id) VALUES (?,?,?)", (item_name, interaction.channel.id, msg_obj.id))
 
     @app_commands.command(name="transfer_item")
     @app_commands.autocomplete(item_name=item_autocomplete)
     async def transfer_item(self, interaction, recipient: discord.Member, item_name: str, amount: int = 1):
         if amount <= 0 or recipient.id == interaction.user.id: return await interaction.response.send_message("❌ ทำรายการไม่ได้", ephemeral=True)
         
-        async with aiosqlite.connect(self.db_path) as db:
+        async def move_item(db):
             async with db.execute("SELECT amount FROM inventory WHERE user_id=? AND item_name=?", (interaction.user.id, item_name)) as c:
                 res = await c.fetchone()
             
-            if not res or res[0] < amount: return await interaction.response.send_message("❌ ไอเทมไม่พอ", ephemeral=True)
+            if not res or res[0] < amount: return None
 
             if res[0] == amount: await db.execute("DELETE FROM inventory WHERE user_id=? AND item_name=?", (interaction.user.id, item_name))
             else: await db.execute("UPDATE inventory SET amount=amount-? WHERE user_id=? AND item_name=?", (amount, interaction.user.id, item_name))
 
-            async with db.execute("SELECT amount FROM inventory WHERE user_id=? AND item_name=?", (recipient.id, item_name)) as c:
-                has = await c.fetchone()
-            if has: await db.execute("UPDATE inventory SET amount=amount+? WHERE user_id=? AND item_name=?", (amount, recipient.id, item_name))
-            else: await db.execute("INSERT INTO inventory (user_id, item_name, amount) VALUES (?,?,?)", (recipient.id, item_name, amount))
-            
-            await db.commit()
+            await db.execute("INSERT INTO inventory (user_id, item_name, amount) VALUES (?,?,?) ON CONFLICT(user_id, item_name) DO UPDATE SET amount=amount+excluded.amount", (recipient.id, item_name, amount))
+            return res[0] == amount # ผู้ส่งหมดไอเทมนี้แล้วหรือไม่
+
+        emptied = await self.db.write(move_item)
+        if emptied is None: return await interaction.response.send_message("❌ ไอเทมไม่พอ", ephemeral=True)
+        if emptied: self.item_index.discard(interaction.user.id, item_name)
+        self.item_index.add(recipient.id, item_name)
         
         await interaction.response.send_message(f"🎁 ส่ง **{item_name}** x{amount} ให้ {recipient.mention} แล้ว", ephemeral=False)
 
@@ -3,13 +3,12 @@ from discord.ext import commands
 from discord import app_commands
 import aiosqlite
 import typing
-import os
-import asyncio
 import datetime
+from services.provisioning import clear_provisioning_in
+from services.bulk_delete import delete_channels
 
 # --- ⚙️ การตั้งค่า ---
 CURRENCY_SYMBOL = "R" 
-DB_NAME = 'school_data.db' 
 STAFF_ROLE_NAME = 'Student Council' 
 STAFF_ACCESS_ROLES = ["Student Council", "Professor", "Empress of TRA", "Vault Keeper"] 
 
@@ -23,55 +22,30 @@ AFFILIATION_ROLES = {
     "royal staff": ("Royal Staff", "https://iili.io/f3RXjgp.png", discord.Color.purple()),
 }
 
+# เธรดส่วนตัวที่สร้างตอนลงทะเบียน: (kind, ชื่อเธรด, คอลัมน์ใน student_profiles, ข้อความต้อนรับ)
+PROFILE_THREADS = (
+    ('main', "📜—Biography", 'thread_id', "{staff}\n> **Biography**\n> {mention}"),
+    ('wallet', "💰—Wallet", 'wallet_thread_id', "{staff}\n> **Wallet**\n> Use `/balance`"),
+    ('inv', "📦—Inventory", 'inventory_thread_id', "{staff}\n> **Inventory**"),
+    ('trade', "⚔️—Trading", 'trading_thread_id', None),
+    ('desk', "📚—Desk", 'desk_thread_id', None),
+)
+
 class Profile(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.db_path = os.path.join(os.getcwd(), DB_NAME)
-
-    async def cog_load(self):
-        # สร้างตาราง student_profiles ในฐานข้อมูล
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS student_profiles (
-                    user_id INTEGER PRIMARY KEY,
-                    profile_name TEXT,
-                    grade TEXT,
-                    faceclaim TEXT,
-                    image_url TEXT,
-                    affiliation_role TEXT,
-                    logo_url TEXT,
-                    thread_id INTEGER,
-                    wallet_thread_id INTEGER,
-                    inventory_thread_id INTEGER,
-                    trading_thread_id INTEGER,
-                    desk_thread_id INTEGER,
-                    id_card_url TEXT
-                )
-            """)
-            await db.commit()
+        self.db = bot.db
 
     # --- ✨ Helper Functions (Async) ---
     async def _get_profile_data(self, user_id: int):
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row # เพื่อให้เรียกชื่อคอลัมน์ได้
-            async with db.execute("SELECT * FROM student_profiles WHERE user_id = ?", (user_id,)) as cursor:
-                return await cursor.fetchone()
+        # Connection ของ Database กลางใช้ aiosqlite.Row อยู่แล้ว (เรียกชื่อคอลัมน์ได้)
+        return await self.db.fetchone("SELECT * FROM student_profiles WHERE user_id = ?", (user_id,))
 
     async def _get_live_royals_balance(self, user_id: int) -> int:
-        async with aiosqlite.connect(self.db_path) as db:
-            async with db.execute("SELECT balance FROM royals WHERE user_id = ?", (user_id,)) as cursor:
-                result = await cursor.fetchone()
-                return result[0] if result else 0
+        return await self.bot.ledger.balance(user_id)
 
     async def _get_rp_stats(self, user_id: int) -> int:
-        async with aiosqlite.connect(self.db_path) as db:
-            # เช็คตารางก่อน
-            async with db.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='rp_rewards'") as cursor:
-                if not await cursor.fetchone(): return 0
-            
-            async with db.execute("SELECT COUNT(*) FROM rp_rewards WHERE user_id = ?", (user_id,)) as cursor:
-                result = await cursor.fetchone()
-                return result[0] if result else 0
+        return await self.db.fetchval("SELECT post_count FROM rp_stats WHERE user_id = ?", (user_id,), 0)
 
     # --- 🖼️ Embed Creator ---
     def create_profile_embed(self, member: discord.Member, data: aiosqlite.Row, affiliation_data: tuple):
@@ -127,7 +101,7 @@ class Profile(commands.Cog):
         if profile:
              return await interaction.response.send_message(f"❌ คุณมีโปรไฟล์แล้ว! <#{profile['thread_id']}>", ephemeral=True)
         
-        await interaction.response.send_modal(ProfileSetupModal(self.db_path))
+        await interaction.response.send_modal(ProfileSetupModal(self.db))
 
     @app_commands.command(name="profile", description="แสดงบัตรนักเรียนของคุณ")
     async def profile_command(self, interaction: discord.Interaction, member: discord.Member = None):
@@ -162,9 +136,7 @@ class Profile(commands.Cog):
         if not profile:
             return await interaction.followup.send("❌ สมาชิกยังไม่มีโปรไฟล์", ephemeral=True)
 
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute("UPDATE student_profiles SET id_card_url = ? WHERE user_id = ?", (image_url, member.id))
-            await db.commit()
+        await self.db.execute("UPDATE student_profiles SET id_card_url = ? WHERE user_id = ?", (image_url, member.id))
 
         await interaction.followup.send(f"✅ บันทึกรูปบัตรให้ {member.display_name} แล้ว", ephemeral=True)
 
@@ -175,9 +147,7 @@ class Profile(commands.Cog):
 
         await interaction.response.defer(ephemeral=True)
         
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute("UPDATE student_profiles SET id_card_url = NULL WHERE user_id = ?", (member.id,))
-            await db.commit()
+        await self.db.execute("UPDATE student_profiles SET id_card_url = NULL WHERE user_id = ?", (member.id,))
 
         await interaction.followup.send(f"🗑️ ลบรูปบัตรของ {member.display_name} แล้ว", ephemeral=True)
 
@@ -214,33 +184,28 @@ class Profile(commands.Cog):
         if not profile:
              return await interaction.followup.send("⚠️ ไม่พบโปรไฟล์", ephemeral=True)
 
-        # Delete Threads
-        threads = [
-            profile['thread_id'], profile['wallet_thread_id'], 
-            profile['inventory_thread_id'], profile['trading_thread_id'], 
-            profile['desk_thread_id']
-        ]
-        
-        for tid in threads:
-            if tid:
-                try: await (self.bot.get_channel(tid)).delete()
-                except: pass
+        # Delete Threads (พร้อมกัน, เธรดที่ archive แล้วไม่อยู่ใน cache จะถูก fetch)
+        report = await delete_channels(self.bot, [profile[col] for _, _, col, _ in PROFILE_THREADS])
 
         # Delete Data from DB
-        async with aiosqlite.connect(self.db_path) as db:
+        async def delete_rows(db):
             await db.execute("DELETE FROM student_profiles WHERE user_id = ?", (member.id,))
             await db.execute("DELETE FROM royals WHERE user_id = ?", (member.id,))
             await db.execute("DELETE FROM inventory WHERE user_id = ?", (member.id,))
             # Add other deletions if needed
-            await db.commit()
+        await self.db.write(delete_rows)
+        self.bot.ledger.forget(member.id)
+        self.bot.threads.invalidate(member.id)
+        self.bot.item_index.invalidate(member.id)
 
-        await interaction.followup.send(f"🗑️ ลบโปรไฟล์ {member.display_name} เรียบร้อย", ephemeral=False)
+        note = f"\n⚠️ ลบเธรดไม่ได้ {report['failed']} ห้อง" if report['failed'] else ""
+        await interaction.followup.send(f"🗑️ ลบโปรไฟล์ {member.display_name} เรียบร้อย{note}", ephemeral=False)
 
 # --- UI Classes ---
 class ProfileSetupModal(discord.ui.Modal, title='ตั้งค่าโปรไฟล์สมาชิก'):
-    def __init__(self, db_path):
+    def __init__(self, db):
         super().__init__()
-        self.db_path = db_path
+        self.db = db
         self.profile_name = discord.ui.TextInput(label='ชื่อตัวละคร', required=True)
         self.grade_input = discord.ui.TextInput(label='ชั้นปี', required=True)
         self.faceclaim_input = discord.ui.TextInput(label='เฟซเคลม', required=True)
@@ -251,15 +216,15 @@ class ProfileSetupModal(discord.ui.Modal, title='ตั้งค่าโปร
         await interaction.response.defer(ephemeral=True)
         view = AffiliationSelectView(
             self.profile_name.value, self.grade_input.value, 
-            self.faceclaim_input.value, self.image_url.value, self.db_path
+            self.faceclaim_input.value, self.image_url.value, self.db
         )
         await interaction.followup.send("✅ ข้อมูลเบื้องต้นบันทึกแล้ว! กรุณาเลือกสังกัด:", view=view, ephemeral=True)
 
 class AffiliationSelectView(discord.ui.View):
-    def __init__(self, name, grade, fc, img, db_path):
+    def __init__(self, name, grade, fc, img, db):
         super().__init__(timeout=300)
         self.data = {'name': name, 'grade': grade, 'fc': fc, 'img': img}
-        self.db_path = db_path
+        self.db = db
         
         options = [discord.SelectOption(label=v[0], value=k) for k, v in AFFILIATION_ROLES.items()]
         self.select = discord.ui.Select(placeholder="เลือกสังกัด...", options=options)
@@ -278,61 +243,44 @@ class AffiliationSelectView(discord.ui.View):
             try: await member.add_roles(role)
             except: pass 
 
-        # 2. Create Threads
-        threads = {}
+        # 2. Create Threads (สร้าง + เพิ่มสมาชิก + ข้อความต้อนรับ พร้อมกันทุกห้อง)
+        staffs = []
+        for r_name in STAFF_ACCESS_ROLES:
+            r = discord.utils.get(interaction.guild.roles, name=r_name)
+            if r: staffs.append(r.mention)
+        staff_tag = " ".join(staffs) if staffs else "Staff"
+
+        specs = [(kind, name, welcome.format(staff=staff_tag, mention=member.mention) if welcome else None) for kind, name, _, welcome in PROFILE_THREADS]
         try:
-            # สร้างเธรดแบบไล่ลำดับ (รอ Discord API นิดนึงกัน Rate Limit)
-            threads['main'] = await interaction.channel.create_thread(name=f"📜—Biography", type=discord.ChannelType.private_thread)
-            await asyncio.sleep(0.5)
-            threads['wallet'] = await interaction.channel.create_thread(name=f"💰—Wallet", type=discord.ChannelType.private_thread)
-            await asyncio.sleep(0.5)
-            threads['inv'] = await interaction.channel.create_thread(name=f"📦—Inventory", type=discord.ChannelType.private_thread)
-            await asyncio.sleep(0.5)
-            threads['trade'] = await interaction.channel.create_thread(name=f"⚔️—Trading", type=discord.ChannelType.private_thread)
-            await asyncio.sleep(0.5)
-            threads['desk'] = await interaction.channel.create_thread(name=f"📚—Desk", type=discord.ChannelType.private_thread)
+            threads = await interaction.client.provisioner.provision(interaction.channel, member, specs)
         except Exception as e:
-            return await interaction.followup.send(f"Error creating threads: {e}", ephemeral=True)
+            # เธรดที่สร้างไปแล้วถูกจดไว้ เลือกสังกัดใหม่อีกครั้งจะใช้เธรดเดิมต่อ
+            return await interaction.followup.send(f"Error creating threads: {e}\nลองเลือกสังกัดอีกครั้ง (เธรดที่สร้างแล้วจะถูกใช้ต่อ)", ephemeral=True)
 
         # 3. Clear Application DB
-        async with aiosqlite.connect(self.db_path) as db:
+        async def save_profile(db):
             await db.execute("DELETE FROM applications WHERE user_id=?", (member.id,))
+            await clear_provisioning_in(db, member.id)
             
             # 4. Save to Database (Not JSON)
-            await db.execute("""
+            thread_cols = [col for _, _, col, _ in PROFILE_THREADS]
+            await db.execute(f"""
                 INSERT OR REPLACE INTO student_profiles 
-                (user_id, profile_name, grade, faceclaim, image_url, affiliation_role, logo_url, 
-                 thread_id, wallet_thread_id, inventory_thread_id, trading_thread_id, desk_thread_id)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                (user_id, profile_name, grade, faceclaim, image_url, affiliation_role, logo_url, {', '.join(thread_cols)})
+                VALUES (?, ?, ?, ?, ?, ?, ?, {', '.join('?' * len(thread_cols))})
             """, (
                 member.id, self.data['name'], self.data['grade'], self.data['fc'], self.data['img'], 
                 role_name, logo_url,
-                threads['main'].id, threads['wallet'].id, threads['inv'].id, threads['trade'].id, threads['desk'].id
+                *[threads[kind].id for kind, _, _, _ in PROFILE_THREADS]
             ))
-            await db.commit()
+        await self.db.write(save_profile)
+        await interaction.client.threads.refresh(member.id)
 
-        # 5. Setup Threads (Add User & Send Msgs)
-        staffs = []
-        for r_name in STAFF_ACCESS_ROLES:
-            r = discord.utils.get(interaction.guild.roles, name=r_name)
-            if r: staffs.append(r.mention)
-        staff_tag = " ".join(staffs) if staffs else "Staff"
-
-        for t in threads.values():
-            await t.add_user(member)
-            await asyncio.sleep(0.2)
-        
-        await threads['main'].send(f"{staff_tag}\n> **Biography**\n> {member.mention}")
-        await threads['wallet'].send(f"{staff_tag}\n> **Wallet**\n> Use `/balance`")
-        await threads['inv'].send(f"{staff_tag}\n> **Inventory**")
-        
-        # 6. Final Response
+        # 5. Final Response
         await interaction.followup.send(f"✅ เสร็จสิ้น! เชิญที่ {threads['main'].mention}", ephemeral=False)
         
         # Archive
-        for t in threads.values():
-            try: await t.edit(archived=True)
-            except: pass
+        await interaction.client.provisioner.archive(threads.values())
         
         await interaction.message.edit(view=None)
 
@@ -1,12 +1,9 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
-import aiosqlite
 import time 
-import os
 from utils import load_data, PROFILE_FILE
 
-DB_NAME = 'school_data.db'
 STAFF_ROLE_NAME = 'Student Council'       
 START_ROLE_NAME = 'newbie'              
 WELCOME_CHANNEL_ID = 1441105584056303780 
@@ -28,13 +25,7 @@ LAST_JOIN_MEMBER_ID = 0
 class Roles(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.db_path = os.path.join(os.getcwd(), DB_NAME)
-
-    async def cog_load(self):
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute('''CREATE TABLE IF NOT EXISTS applications (user_id INTEGER PRIMARY KEY, application_text TEXT, submitted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
-            await db.execute('''CREATE TABLE IF NOT EXISTS user_data (user_id INTEGER PRIMARY KEY, is_approved BOOLEAN DEFAULT 0)''')
-            await db.commit()
+        self.db = bot.db
 
     @commands.Cog.listener()
     async def on_member_join(self, member):
@@ -49,13 +40,11 @@ class Roles(commands.Cog):
         ch = member.guild.get_channel(WELCOME_CHANNEL_ID) 
         if ch: await ch.send(f'**ยินดีต้อนรับ** {member.mention} ✨\nกรุณาส่งประวัติด้วยคำสั่ง `/apply`')
 
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute("INSERT OR IGNORE INTO user_data (user_id) VALUES (?)", (member.id,))
-            await db.commit()
+        await self.db.execute("INSERT OR IGNORE INTO user_data (user_id) VALUES (?)", (member.id,))
     
     @app_commands.command(name='apply')
     async def apply(self, interaction: discord.Interaction):
-        await interaction.response.send_modal(ApplicationModal(self.bot, self.db_path))
+        await interaction.response.send_modal(ApplicationModal(self.bot, self.db))
 
 class ApplicationModal(discord.ui.Modal, title='ใบสมัคร'):
     def __init__(self, bot, db):
@@ -67,11 +56,12 @@ class ApplicationModal(discord.ui.Modal, title='ใบสมัคร'):
 
     async def on_submit(self, interaction):
         await interaction.response.defer(ephemeral=True) 
-        async with aiosqlite.connect(self.db) as db:
+        async def submit(db):
             async with db.execute("SELECT 1 FROM applications WHERE user_id=?", (interaction.user.id,)) as c:
-                if await c.fetchone(): return await interaction.followup.send("❌ ส่งไปแล้ว", ephemeral=True)
+                if await c.fetchone(): return False
             await db.execute("INSERT INTO applications (user_id, application_text) VALUES (?, ?)", (interaction.user.id, self.text.value))
-            await db.commit()
+            return True
+        if not await self.db.write(submit): return await interaction.followup.send("❌ ส่งไปแล้ว", ephemeral=True)
 
         ch = self.bot.get_channel(STAFF_ALERT_CHANNEL_ID)
         if ch:
@@ -112,18 +102,16 @@ class AffiliationView(discord.ui.View):
         nr = discord.utils.get(interaction.guild.roles, name=START_ROLE_NAME)
         if nr: await m.remove_roles(nr)
         
-        async with aiosqlite.connect(self.db) as db:
+        async def approve_user(db):
             await db.execute("UPDATE user_data SET is_approved=1 WHERE user_id=?", (uid,))
             await db.execute("DELETE FROM applications WHERE user_id=?", (uid,))
-            await db.commit()
+        await self.db.write(approve_user)
         await interaction.message.edit(content=f"✅ อนุมัติ {m.mention} -> {AFFILIATION_ROLES[k]}", view=None, embeds=[])
 
     async def reject(self, interaction):
         await interaction.response.defer()
         uid = int(interaction.data['custom_id'].split('_')[1])
-        async with aiosqlite.connect(self.db) as db:
-            await db.execute("DELETE FROM applications WHERE user_id=?", (uid,))
-            await db.commit()
+        await self.db.execute("DELETE FROM applications WHERE user_id=?", (uid,))
         await interaction.message.edit(content="🛑 ปฏิเสธแล้ว", view=None, embeds=[])
 
 async def setup(bot):
@@ -1,12 +1,10 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
-import aiosqlite
-import os
 import datetime
-from utils import load_data, PROFILE_FILE 
+from services.ledger import credit_in
+from services.id_set import IdSet
 
-DB_NAME = 'school_data.db' 
 CURRENCY_SYMBOL = "R"
 RP_COOLDOWN_SECONDS = 60      
 RP_MIN_LENGTH = 250
@@ -17,17 +15,28 @@ RP_CHANNEL_REWARDS = {
     1441113703062835291: 1,
 }
 
-LAST_RP_POST = {} 
+# rp_stats = ยอดรวมต่อคนที่อัปเดตใน transaction เดียวกับ rp_rewards (ไม่ต้อง GROUP BY ทั้งตาราง)
+RP_STATS_ADD = """
+    INSERT INTO rp_stats (user_id, post_count, total_earned, last_post) VALUES (?, 1, ?, ?)
+    ON CONFLICT(user_id) DO UPDATE SET post_count = post_count + 1, total_earned = total_earned + excluded.total_earned, last_post = excluded.last_post
+"""
+RP_STATS_REMOVE = """
+    UPDATE rp_stats SET post_count = post_count - ?, total_earned = total_earned - ?,
+        last_post = (SELECT MAX(timestamp) FROM rp_rewards WHERE user_id = rp_stats.user_id)
+    WHERE user_id = ?
+"""
 
 class RPSystem(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.db_path = os.path.join(os.getcwd(), DB_NAME)
+        self.db = bot.db
+        self.ledger = bot.ledger
+        self.cooldowns = bot.cooldowns
+        self.rewarded = IdSet() # message_id ที่ได้รางวัล: ลบข้อความอื่นไม่ต้องแตะ DB
 
     async def cog_load(self):
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute("CREATE TABLE IF NOT EXISTS rp_rewards (message_id INTEGER PRIMARY KEY, user_id INTEGER, amount INTEGER, timestamp TEXT)")
-            await db.commit()
+        rows = await self.db.fetchall("SELECT message_id FROM rp_rewards")
+        self.rewarded = IdSet(r[0] for r in rows)
 
     async def _notify(self, user, embed, is_revoke=False):
         if is_revoke:
@@ -37,13 +46,7 @@ class RPSystem(commands.Cog):
             embed.title = "🎁 RP Reward"
             embed.color = discord.Color.blue()
 
-        try:
-            p = load_data(PROFILE_FILE)
-            wid = p.get(str(user.id), {}).get('wallet_thread_id')
-            if wid:
-                ch = self.bot.get_channel(int(wid))
-                if ch: await ch.send(embed=embed)
-        except: pass
+        await self.bot.outbox.enqueue(user, embed)
 
     @app_commands.command(name="roleplay_stats")
     async def rp_stats(self, interaction: discord.Interaction, member: discord.Member = None):
@@ -52,11 +55,8 @@ class RPSystem(commands.Cog):
              if not any(r.name in STAFF_ACCESS_ROLES for r in interaction.user.roles):
                  return await interaction.response.send_message("❌ ไม่มีสิทธิ์ดูของคนอื่น", ephemeral=True)
 
-        async with aiosqlite.connect(self.db_path) as db:
-            async with db.execute("SELECT COUNT(*), SUM(amount) FROM rp_rewards WHERE user_id = ?", (target.id,)) as cursor:
-                res = await cursor.fetchone()
-                count, earned = res if res else (0, 0)
-                earned = earned or 0
+        res = await self.db.fetchone("SELECT post_count, total_earned FROM rp_stats WHERE user_id = ?", (target.id,))
+        count, earned = res if res else (0, 0)
         
         embed = discord.Embed(title=f"🎭 RP Stats: {target.display_name}", color=target.color)
         embed.add_field(name="Posts", value=f"{count}")
@@ -65,9 +65,7 @@ class RPSystem(commands.Cog):
 
     @app_commands.command(name="rp_leaderboard")
     async def leaderboard(self, interaction):
-        async with aiosqlite.connect(self.db_path) as db:
-            async with db.execute("SELECT user_id, COUNT(*), SUM(amount) FROM rp_rewards GROUP BY user_id ORDER BY COUNT(*) DESC LIMIT 10") as c:
-                data = await c.fetchall()
+        data = await self.db.fetchall("SELECT user_id, post_count, total_earned FROM rp_stats WHERE post_count > 0 ORDER BY post_count DESC, total_earned DESC LIMIT 10")
         
         txt = ""
         for idx, (uid, cnt, amt) in enumerate(data, 1):
@@ -77,6 +75,27 @@ class RPSystem(commands.Cog):
             
         await interaction.response.send_message(embed=discord.Embed(title="🏆 RP Leaderboard", description=txt, color=discord.Color.gold()))
 
+    @app_commands.command(name="rp_stats_rebuild", description="[STAFF] คำนวณสถิติ RP ใหม่จากประวัติรางวัลทั้งหมด")
+    async def rebuild_stats(self, interaction: discord.Interaction):
+        if not any(r.name in STAFF_ACCESS_ROLES for r in interaction.user.roles):
+            return await interaction.response.send_message("❌ ไม่มีสิทธิ์", ephemeral=True)
+
+        await interaction.response.defer(ephemeral=True)
+        async def rebuild(db):
+            await db.execute("DELETE FROM rp_stats")
+            # รวมยอดที่ถูกย้ายไปสรุปรายเดือนแล้ว (rp_rewards_monthly) ด้วย
+            await db.execute("""
+                INSERT INTO rp_stats (user_id, post_count, total_earned, last_post)
+                SELECT user_id, SUM(posts), SUM(earned), MAX(last_post) FROM (
+                    SELECT user_id, COUNT(*) AS posts, COALESCE(SUM(amount), 0) AS earned, MAX(timestamp) AS last_post FROM rp_rewards GROUP BY user_id
+                    UNION ALL
+                    SELECT user_id, posts, earned, NULL FROM rp_rewards_monthly
+                ) GROUP BY user_id
+            """)
+            async with db.execute("SELECT COUNT(*) FROM rp_stats") as c: return (await c.fetchone())[0]
+        users = await self.db.write(rebuild)
+        await interaction.followup.send(f"✅ คำนวณสถิติ RP ใหม่แล้ว ({users} คน)", ephemeral=True)
+
     @commands.Cog.listener()
     async def on_message(self, message):
         if message.author.bot or not message.guild: return
@@ -85,44 +104,61 @@ class RPSystem(commands.Cog):
         reward = RP_CHANNEL_REWARDS.get(cid)
         if not reward: return
 
-        now = datetime.datetime.now().timestamp()
-        if now - LAST_RP_POST.get(message.author.id, 0) < RP_COOLDOWN_SECONDS: return
+        if self.cooldowns.remaining('rp_post', message.author.id): return
         if len(message.content) < RP_MIN_LENGTH: return
+        self.cooldowns.set('rp_post', message.author.id, RP_COOLDOWN_SECONDS) # ตั้งก่อน await กันโพสต์รัวซ้อนกัน
 
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute("INSERT INTO royals (user_id, balance) VALUES (?, ?) ON CONFLICT(user_id) DO UPDATE SET balance = balance + ?", (message.author.id, reward, reward))
-            await db.execute("INSERT INTO rp_rewards (message_id, user_id, amount, timestamp) VALUES (?, ?, ?, ?)", (message.id, message.author.id, reward, datetime.datetime.now().isoformat()))
-            await db.commit()
-            
-            async with db.execute("SELECT balance FROM royals WHERE user_id = ?", (message.author.id,)) as cursor:
-                bal = (await cursor.fetchone())[0]
-        
-        LAST_RP_POST[message.author.id] = now
+        async def give_reward(db):
+            ts = datetime.datetime.now().isoformat()
+            await db.execute("INSERT INTO rp_rewards (message_id, user_id, amount, timestamp) VALUES (?, ?, ?, ?)", (message.id, message.author.id, reward, ts))
+            await db.execute(RP_STATS_ADD, (message.author.id, reward, ts))
+            return await credit_in(db, message.author.id, reward, None)
+        self.rewarded.add(message.id) # ใส่ก่อนเขียน กันการลบที่เข้ามาระหว่างรอ (ถ้าเขียนไม่สำเร็จก็แค่ query เปล่า)
+        bal = await self.db.write(give_reward)
+        self.ledger.remember(message.author.id, bal)
         
         embed = discord.Embed(description=f"ได้รับ **{reward} R**\nคงเหลือ: `{bal} R`")
         await self._notify(message.author, embed)
 
+    async def _revoke(self, guild_id: int, message_ids):
+        """หักรางวัลของโพสต์ที่ถูกลบทั้งหมดใน transaction เดียว แล้วแจ้งคนละ 1 ข้อความ"""
+        ids = [mid for mid in message_ids if mid in self.rewarded]
+        if not ids: return
+        marks = ','.join('?' * len(ids))
+
+        async def revoke(db):
+            async with db.execute(f"SELECT user_id, COUNT(*), SUM(amount) FROM rp_rewards WHERE message_id IN ({marks}) GROUP BY user_id", ids) as c:
+                totals = await c.fetchall()
+            if not totals: return []
+
+            await db.execute(f"DELETE FROM rp_rewards WHERE message_id IN ({marks})", ids)
+            await db.executemany(RP_STATS_REMOVE, [(cnt, amt, uid) for uid, cnt, amt in totals])
+            results = []
+            for uid, cnt, amt in totals:
+                async with db.execute("UPDATE royals SET balance = balance - ? WHERE user_id = ? RETURNING balance", (amt, uid)) as cursor:
+                    row = await cursor.fetchone()
+                results.append((uid, cnt, amt, row[0] if row else 0))
+            return results
+
+        results = await self.db.write(revoke)
+        for mid in ids: self.rewarded.discard(mid)
+
+        guild = self.bot.get_guild(guild_id)
+        for uid, cnt, amt, bal in results:
+            self.ledger.remember(uid, bal)
+            member = guild.get_member(uid) if guild else None
+            if member:
+                reason = "ลบโพสต์" if cnt == 1 else f"ลบ {cnt} โพสต์"
+                embed = discord.Embed(description=f"หักคืน **-{amt} R** ({reason})\nคงเหลือ: `{bal} R`")
+                await self._notify(member, embed, is_revoke=True)
+
     @commands.Cog.listener()
     async def on_raw_message_delete(self, payload):
-        async with aiosqlite.connect(self.db_path) as db:
-            async with db.execute("SELECT user_id, amount FROM rp_rewards WHERE message_id = ?", (payload.message_id,)) as c:
-                data = await c.fetchone()
-            
-            if data:
-                uid, amt = data
-                await db.execute("UPDATE royals SET balance = balance - ? WHERE user_id = ?", (amt, uid))
-                await db.execute("DELETE FROM rp_rewards WHERE message_id = ?", (payload.message_id,))
-                await db.commit()
-                
-                async with db.execute("SELECT balance FROM royals WHERE user_id = ?", (uid,)) as cursor:
-                    bal = (await cursor.fetchone())[0]
-                
-                guild = self.bot.get_guild(payload.guild_id)
-                if guild:
-                    member = guild.get_member(uid)
-                    if member:
-                        embed = discord.Embed(description=f"หักคืน **-{amt} R** (ลบโพสต์)\nคงเหลือ: `{bal} R`")
-                        await self._notify(member, embed, is_revoke=True)
+        await self._revoke(payload.guild_id, (payload.message_id,))
+
+    @commands.Cog.listener()
+    async def on_raw_bulk_message_delete(self, payload):
+        await self._revoke(payload.guild_id, payload.message_ids)
 
 async def setup(bot):
     await bot.add_cog(RPSystem(bot))
@@ -1,25 +1,30 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
-import aiosqlite
-import os
 import datetime
 import random
 import asyncio
-from utils import load_data, PROFILE_FILE 
+from services.ledger import debit_in
 
-DB_NAME = 'school_data.db'
 CURRENCY_SYMBOL = "R"
-SYSTEM_ID = 0 
 
 WEEKLY_LIMIT = 2
 WISH_COST = 10
 TEA_HOST_COST = 0 # จัดฟรี
 TEA_REWARD_HOST = 50
 TEA_REWARD_GUEST = 20
+TEA_AUTO_COMPLETE = True # โพสต์ RP ในห้องระหว่างรอบ = ส่งรอบนั้นทันที ไม่ต้องกดปุ่ม
 
 STAFF_ACCESS_ROLES = ["Student Council", "Professor", "Empress of TRA", "Vault Keeper"]
 
+# จองโควตาแบบมีเงื่อนไข: ได้แถวคืนเมื่อยังไม่เต็มเท่านั้น (กดพร้อมกันก็ใช้เกินไม่ได้)
+QUOTA_RESERVE = """
+    INSERT INTO activity_quota (user_id, activity_type, week_start, used) VALUES (?, ?, ?, 1)
+    ON CONFLICT(user_id, activity_type, week_start) DO UPDATE SET used = used + 1 WHERE used < ?
+    RETURNING used
+"""
+QUOTA_RELEASE = "UPDATE activity_quota SET used = MAX(used - 1, 0) WHERE user_id = ? AND activity_type = ? AND week_start = ?"
+
 POTION_INGREDIENTS = [
     {"label": "น้ำค้างรุ่งอรุณ (Morning Dew)", "value": "dew", "price": 5, "emoji": "💧"},
     {"label": "หางจิ้งจกตากแห้ง (Dried Lizard Tail)", "value": "lizard", "price": 15, "emoji": "🦎"},
@@ -36,49 +41,49 @@ POTION_INGREDIENTS = [
 class SchoolActivities(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.db_path = os.path.join(os.getcwd(), DB_NAME)
+        self.db = bot.db
+        self.ledger = bot.ledger
+        self.tea_rounds = {} # channel_id -> {TeaPartyRoleplayView} ที่กำลังเล่นอยู่ในห้องนั้น (จัดพร้อมกันได้หลายงาน)
 
-    async def cog_load(self):
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS activity_logs (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    activity_type TEXT,
-                    timestamp TEXT
-                )
-            """)
-            await db.commit()
+    @commands.Cog.listener()
+    async def on_message(self, message):
+        views = self.tea_rounds.get(message.channel.id)
+        if not views or message.author.bot: return
+        for view in list(views): await view.record_post(message)
 
     def _get_week_start(self):
-        today = datetime.datetime.utcnow()
-        start_of_week = today - datetime.timedelta(days=today.weekday())
-        return start_of_week.replace(hour=0, minute=0, second=0, microsecond=0).isoformat()
+        today = datetime.datetime.utcnow().date()
+        return (today - datetime.timedelta(days=today.weekday())).isoformat()
+
+    async def _get_used_quota(self, user_id: int, activity_type: str) -> int:
+        return await self.db.fetchval("SELECT used FROM activity_quota WHERE user_id = ? AND activity_type = ? AND week_start = ?",
+                                      (user_id, activity_type, self._get_week_start()), 0)
 
     async def _check_weekly_limit(self, user_id: int, activity_type: str) -> bool:
-        week_start = self._get_week_start()
-        async with aiosqlite.connect(self.db_path) as db:
-            async with db.execute("SELECT COUNT(*) FROM activity_logs WHERE user_id = ? AND activity_type = ? AND timestamp >= ?", 
-                                  (user_id, activity_type, week_start)) as cursor:
-                count = (await cursor.fetchone())[0]
-        return count < WEEKLY_LIMIT
-
-    async def _log_activity(self, user_id: int, activity_type: str):
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute("INSERT INTO activity_logs (user_id, activity_type, timestamp) VALUES (?, ?, ?)", 
-                             (user_id, activity_type, datetime.datetime.utcnow().isoformat()))
-            await db.commit()
+        return await self._get_used_quota(user_id, activity_type) < WEEKLY_LIMIT
 
     async def _get_remaining_quota(self, user_id: int, activity_type: str) -> int:
+        return max(0, WEEKLY_LIMIT - await self._get_used_quota(user_id, activity_type))
+
+    async def _start_activity(self, user_id: int, activity_type: str, cost: int, tx_type: str):
+        """ใช้โควตา + หักเงิน + บันทึก log ใน transaction เดียว คืน (error, ยอดเงินใหม่) โดย error เป็น None, 'quota' หรือ 'funds'"""
         week_start = self._get_week_start()
-        async with aiosqlite.connect(self.db_path) as db:
-            async with db.execute("SELECT COUNT(*) FROM activity_logs WHERE user_id = ? AND activity_type = ? AND timestamp >= ?", 
-                                  (user_id, activity_type, week_start)) as cursor:
-                count = (await cursor.fetchone())[0]
-        return max(0, WEEKLY_LIMIT - count)
+        async def start(db):
+            async with db.execute(QUOTA_RESERVE, (user_id, activity_type, week_start, WEEKLY_LIMIT)) as c:
+                if not await c.fetchone(): return 'quota', None
+            bal = await debit_in(db, user_id, cost, tx_type)
+            if bal is None:
+                await db.execute(QUOTA_RELEASE, (user_id, activity_type, week_start))
+                return 'funds', None
+            await db.execute("INSERT INTO activity_logs (user_id, activity_type, timestamp) VALUES (?, ?, ?)", 
+                             (user_id, activity_type, datetime.datetime.utcnow().isoformat()))
+            return None, bal
+        error, bal = await self.db.write(start)
+        if bal is not None: self.ledger.remember(user_id, bal)
+        return error, bal
 
     async def _remove_last_activity_log(self, user_id: int, activity_type: str):
-        async with aiosqlite.connect(self.db_path) as db:
+        async def remove(db):
             await db.execute("""
                 DELETE FROM activity_logs 
                 WHERE id = (
@@ -87,30 +92,16 @@ class SchoolActivities(commands.Cog):
                     ORDER BY timestamp DESC LIMIT 1
                 )
             """, (user_id, activity_type))
-            await db.commit()
+            await db.execute(QUOTA_RELEASE, (user_id, activity_type, self._get_week_start()))
+        await self.db.write(remove)
 
     async def _notify_wallet_thread(self, target_member, embed):
-        try:
-            profiles = load_data(PROFILE_FILE)
-            wallet_id = profiles.get(str(target_member.id), {}).get('wallet_thread_id')
-            if wallet_id:
-                channel = self.bot.get_channel(int(wallet_id))
-                if channel: await channel.send(embed=embed)
-        except: pass
+        await self.bot.outbox.enqueue(target_member, embed)
 
     async def _process_transaction(self, user_id: int, amount: int, tx_type: str, is_income: bool):
-        async with aiosqlite.connect(self.db_path) as db:
-            timestamp = datetime.datetime.utcnow().isoformat()
-            if is_income:
-                await db.execute("UPDATE royals SET balance = balance + ? WHERE user_id = ?", (amount, user_id))
-                await db.execute("INSERT INTO transactions (timestamp, type, source_id, target_id, amount) VALUES (?, ?, ?, ?, ?)", (timestamp, tx_type, SYSTEM_ID, user_id, amount))
-            else:
-                await db.execute("UPDATE royals SET balance = balance - ? WHERE user_id = ?", (amount, user_id))
-                await db.execute("INSERT INTO transactions (timestamp, type, source_id, target_id, amount) VALUES (?, ?, ?, ?, ?)", (timestamp, tx_type, user_id, SYSTEM_ID, amount))
-            await db.commit()
-            async with db.execute("SELECT balance FROM royals WHERE user_id = ?", (user_id,)) as cursor:
-                new_bal = (await cursor.fetchone())[0]
-        return new_bal
+        # รายจ่ายหักแบบมีเงื่อนไข: คืน None ถ้าเงินไม่พอ (กันยอดติดลบจากการกดพร้อมกัน)
+        if is_income: return await self.ledger.credit(user_id, amount, tx_type)
+        return await self.ledger.debit(user_id, amount, tx_type)
 
     @app_commands.command(name="reset_activity_limit", description="[STAFF] รีเซ็ตโควตากิจกรรมของสมาชิก")
     async def reset_activity_limit(self, interaction: discord.Interaction, member: discord.Member, activity: str = None):
@@ -118,31 +109,24 @@ class SchoolActivities(commands.Cog):
             return await interaction.response.send_message("❌ คุณไม่มีสิทธิ์ใช้คำสั่งนี้", ephemeral=True)
         
         await interaction.response.defer(ephemeral=True)
-        async with aiosqlite.connect(self.db_path) as db:
-            if activity:
-                await db.execute("DELETE FROM activity_logs WHERE user_id = ? AND activity_type = ?", (member.id, activity))
-                msg = f"✅ รีเซ็ตโควตา **{activity}** ของ {member.mention} เรียบร้อยแล้ว"
-            else:
-                await db.execute("DELETE FROM activity_logs WHERE user_id = ?", (member.id,))
-                msg = f"✅ รีเซ็ตโควตา **ทุกกิจกรรม** ของ {member.mention} เรียบร้อยแล้ว"
-            await db.commit()
+        week_start = self._get_week_start()
+        if activity:
+            await self.db.execute("DELETE FROM activity_quota WHERE user_id = ? AND activity_type = ? AND week_start = ?", (member.id, activity, week_start))
+            msg = f"✅ รีเซ็ตโควตา **{activity}** ของ {member.mention} เรียบร้อยแล้ว"
+        else:
+            await self.db.execute("DELETE FROM activity_quota WHERE user_id = ? AND week_start = ?", (member.id, week_start))
+            msg = f"✅ รีเซ็ตโควตา **ทุกกิจกรรม** ของ {member.mention} เรียบร้อยแล้ว"
         await interaction.followup.send(msg, ephemeral=True)
 
     @app_commands.command(name="wish", description="โยนเหรียญ 10 R ลงบ่อ (จำกัด 2 ครั้ง/สัปดาห์)")
     async def wish(self, interaction: discord.Interaction):
-        if not await self._check_weekly_limit(interaction.user.id, "wish"):
+        error, balance = await self._start_activity(interaction.user.id, "wish", WISH_COST, "LUCK_WISH_TOSS")
+        if error == 'quota':
             return await interaction.response.send_message("❌ คุณใช้โควตา 'ขอพร' ครบ 2 ครั้งในสัปดาห์นี้แล้ว", ephemeral=True)
-
-        async with aiosqlite.connect(self.db_path) as db:
-            async with db.execute("SELECT balance FROM royals WHERE user_id = ?", (interaction.user.id,)) as cursor:
-                res = await cursor.fetchone()
-                balance = res[0] if res else 0
-        
-        if balance < WISH_COST: 
+        if error == 'funds': 
             return await interaction.response.send_message(f"❌ เงินไม่พอ (ต้องการ {WISH_COST} {CURRENCY_SYMBOL})", ephemeral=True)
 
         await interaction.response.defer(ephemeral=False)
-        await self._process_transaction(interaction.user.id, WISH_COST, "LUCK_WISH_TOSS", False)
         await interaction.followup.send(f"🪙 **{interaction.user.display_name}** โยนเหรียญ {WISH_COST} {CURRENCY_SYMBOL} ลงบ่อน้ำ...\n*จ๋อม!*")
         await asyncio.sleep(2)
 
@@ -156,14 +140,11 @@ class SchoolActivities(commands.Cog):
 
         prize = WISH_COST * multiplier
         embed = discord.Embed(title="⛲ ผลคำอธิษฐาน", color=discord.Color.blue())
-        new_bal = 0
+        new_bal = balance
 
         if multiplier == 0:
             embed.description = "เหรียญจมหายไปในความมืด... ไม่มีอะไรเกิดขึ้น\n💸 **เสียเงินฟรี**"
             embed.color = discord.Color.dark_grey()
-            async with aiosqlite.connect(self.db_path) as db:
-                async with db.execute("SELECT balance FROM royals WHERE user_id = ?", (interaction.user.id,)) as cursor:
-                    new_bal = (await cursor.fetchone())[0]
         else:
             new_bal = await self._process_transaction(interaction.user.id, prize, "LUCK_WISH_GRANT", True)
             desc_text = "รู้สึกจิตใจสงบ... เทพธิดาคืนเหรียญให้คุณ" if multiplier == 1 else \
@@ -178,7 +159,6 @@ class SchoolActivities(commands.Cog):
             elif multiplier == 3: embed.color = discord.Color.gold()
             embed.description = f"{desc_text}\n✨ **ได้รับคืน:** `{prize} {CURRENCY_SYMBOL}` (x{multiplier})"
 
-        await self._log_activity(interaction.user.id, "wish")
         rem = await self._get_remaining_quota(interaction.user.id, "wish")
         embed.set_footer(text=f"โควตาขอพรคงเหลือ: {rem}/2 | ยอดเงิน: {new_bal:,} {CURRENCY_SYMBOL}")
         
@@ -208,12 +188,13 @@ class SchoolActivities(commands.Cog):
         if not (2 <= max_participants <= 10): 
             return await interaction.response.send_message("❌ จำนวนคนต้องอยู่ระหว่าง 2 - 10 คน", ephemeral=True)
         
-        if not await self._check_weekly_limit(interaction.user.id, "host_teaparty"): 
+        error, _ = await self._start_activity(interaction.user.id, "host_teaparty", TEA_HOST_COST, "TEA_PARTY_HOST")
+        if error == 'quota': 
             return await interaction.response.send_message("❌ คุณใช้โควตา 'จัดปาร์ตี้' ครบแล้ว", ephemeral=True)
+        if error == 'funds': 
+            return await interaction.response.send_message("❌ เงินไม่พอ", ephemeral=True)
 
         await interaction.response.defer(ephemeral=False)
-        await self._process_transaction(interaction.user.id, TEA_HOST_COST, "TEA_PARTY_HOST", False)
-        await self._log_activity(interaction.user.id, "host_teaparty")
 
         view = TeaPartyLobbyView(interaction.user, theme, max_participants, self)
         embed = discord.Embed(title=f"☕ Tea Party: {theme}", description=f"**{interaction.user.display_name}** เปิดโต๊ะน้ำชา!\nต้องการสมาชิก: **{max_participants} คน**\n\n*เมื่อคนครบแล้ว เจ้าภาพกดเริ่มเพื่อเข้าสู่ช่วงโรลเพลย์*", color=discord.Color.from_rgb(255, 182, 193))
@@ -297,17 +278,12 @@ class PotionBrewingView(discord.ui.View):
         
         total_cost = self.get_total_cost()
         
-        async with aiosqlite.connect(self.cog.db_path) as db:
-            async with db.execute("SELECT balance FROM royals WHERE user_id = ?", (interaction.user.id,)) as c:
-                res = await c.fetchone()
-                bal = res[0] if res else 0
-        
-        if bal < total_cost: return await interaction.response.send_message("❌ เงินไม่พอ", ephemeral=True)
+        error, new_bal = await self.cog._start_activity(interaction.user.id, "brew_potion", total_cost, "LUCK_BREW_COST")
+        if error == 'quota': return await interaction.response.send_message("❌ คุณใช้โควตา 'ปรุงยา' ครบ 2 ครั้งในสัปดาห์นี้แล้ว", ephemeral=True)
+        if error == 'funds': return await interaction.response.send_message("❌ เงินไม่พอ", ephemeral=True)
 
         for child in self.children: child.disabled = True
         await interaction.response.edit_message(view=self)
-
-        new_bal = await self.cog._process_transaction(interaction.user.id, total_cost, "LUCK_BREW_COST", False)
         
         receipt = discord.Embed(title="🧾 จ่ายค่าปรุงยา", color=discord.Color.red())
         receipt.add_field(name="จ่าย", value=f"-{total_cost}")
@@ -346,8 +322,6 @@ class PotionBrewingView(discord.ui.View):
                 title, desc, color = "👑 คุณภาพยอดเยี่ยม", f"คืนทุน + กำไร {bonus} R", discord.Color.purple()
             reward = total_cost + bonus
         
-        await self.cog._log_activity(interaction.user.id, "brew_potion")
-        
         embed = discord.Embed(title=title, description=desc, color=color)
         embed.add_field(name="ลงทุน", value=f"{total_cost}")
         
@@ -426,67 +400,89 @@ class TeaPartyRoleplayView(discord.ui.View):
     def __init__(self, participants, channel, cog, theme, topics, host):
         super().__init__(timeout=1200)
         self.participants = participants
+        self.participant_ids = {p.id for p in participants}
         self.channel = channel
         self.cog = cog
         self.topics = topics
         self.host = host
         self.round = 0
         self.done = set()
+        self.posted = set() # คนที่โพสต์ในรอบนี้แล้ว (ป้อนจาก on_message ของ Cog ไม่ต้องไล่ history)
         self.start_time = None
         self.msg = None
-        self.processing = set()
         self.transitioning = False
+        self._lock = asyncio.Lock()
+
+    def _round_embed(self, footer: str = None):
+        hint = "พิมพ์ RP ในห้องนี้ ระบบจะนับให้อัตโนมัติ" if TEA_AUTO_COMPLETE else "พิมพ์ RP แล้วกดปุ่มส่ง"
+        embed = discord.Embed(title=f"☕ Round {self.round}/3", description=f"**หัวข้อ:** {self.topics[self.round-1]}\n\n{hint}", color=discord.Color.gold())
+        if self.done:
+            lines = [f"{p.mention}: {'✅' if p.id in self.done else '⏳'}" for p in self.participants]
+            embed.add_field(name="Status", value="\n".join(lines))
+        if footer: embed.set_footer(text=footer)
+        return embed
 
     async def start_round(self, channel):
         if self.msg:
-            try:
-                embed = self.msg.embeds[0]
-                embed.set_footer(text="รอบนี้จบแล้ว")
-                await self.msg.edit(view=None, embed=embed)
+            try: await self.msg.edit(view=None, embed=self._round_embed("รอบนี้จบแล้ว"))
             except: pass
 
         self.round += 1
         self.done.clear()
+        self.posted.clear()
         self.start_time = discord.utils.utcnow()
-        embed = discord.Embed(title=f"☕ Round {self.round}/3", description=f"**หัวข้อ:** {self.topics[self.round-1]}\n\nพิมพ์ RP แล้วกดปุ่มส่ง", color=discord.Color.gold())
-        self.msg = await channel.send(embed=embed, view=self)
+        self.cog.tea_rounds.setdefault(channel.id, set()).add(self)
+        self.msg = await channel.send(embed=self._round_embed(), view=self)
         self.transitioning = False
 
-    async def _verify(self, user):
-        async for m in self.channel.history(limit=20):
-            if m.author.id == user.id and m.created_at >= self.start_time: return True
-        return False
+    async def record_post(self, message):
+        if message.author.id not in self.participant_ids or self.transitioning: return
+        if not self.start_time or message.created_at < self.start_time: return
+        self.posted.add(message.author.id)
+        if TEA_AUTO_COMPLETE: await self._complete(message.author.id)
+
+    def _verify(self, user):
+        return user.id in self.posted
+
+    async def _complete(self, user_id: int, interaction=None):
+        async with self._lock:
+            if self.transitioning or user_id in self.done:
+                if interaction: await interaction.response.defer()
+                return
+            self.done.add(user_id)
+            if interaction: await interaction.response.edit_message(embed=self._round_embed())
+            else:
+                try: self.msg = await self.msg.edit(embed=self._round_embed())
+                except: pass
+            if len(self.done) < len(self.participants): return
+            self.transitioning = True
+
+        if self.round < 3: await self.start_round(self.channel)
+        else: await self.finish()
 
     @discord.ui.button(label="Submit RP", style=discord.ButtonStyle.success)
     async def submit(self, interaction, button):
-        if interaction.user not in self.participants: return
-        if interaction.user.id in self.processing: return
-        self.processing.add(interaction.user.id)
-        
-        if await self._verify(interaction.user):
-            self.done.add(interaction.user.id)
-            embed = interaction.message.embeds[0]
-            lines = [f"{p.mention}: {'✅' if p.id in self.done else '⏳'}" for p in self.participants]
-            embed.clear_fields()
-            embed.add_field(name="Status", value="\n".join(lines))
-            await interaction.response.edit_message(embed=embed)
-            
-            if len(self.done) == len(self.participants):
-                if self.transitioning: return
-                self.transitioning = True
-                if self.round < 3: await self.start_round(self.channel)
-                else: await self.finish()
-        else:
-            await interaction.response.send_message("ไม่พบข้อความ RP", ephemeral=True)
-        self.processing.remove(interaction.user.id)
+        if interaction.user.id not in self.participant_ids: return
+        if self._verify(interaction.user): await self._complete(interaction.user.id, interaction)
+        else: await interaction.response.send_message("ไม่พบข้อความ RP", ephemeral=True)
+
+    def _untrack(self):
+        views = self.cog.tea_rounds.get(self.channel.id)
+        if views is None: return
+        views.discard(self)
+        if not views: del self.cog.tea_rounds[self.channel.id]
+
+    async def on_timeout(self):
+        self._untrack()
 
     async def finish(self):
+        self._untrack()
         if self.msg: await self.msg.edit(view=None)
         await self.channel.send(embed=discord.Embed(title="🎉 ปาร์ตี้จบลงแล้ว!", description="ขอบคุณทุกคนที่มาร่วมงาน", color=discord.Color.purple()))
+        rewards = {p.id: TEA_REWARD_HOST if p.id == self.host.id else TEA_REWARD_GUEST for p in self.participants}
+        balances = await self.cog.ledger.credit_many(rewards.items(), "TEA_PARTY")
         for p in self.participants:
-            amt = TEA_REWARD_HOST if p.id == self.host.id else TEA_REWARD_GUEST
-            nb = await self.cog._process_transaction(p.id, amt, "TEA_PARTY", True)
-            rec = discord.Embed(title="Tea Party Reward", description=f"+{amt} R\nBal: {nb}", color=discord.Color.from_rgb(255, 182, 193))
+            rec = discord.Embed(title="Tea Party Reward", description=f"+{rewards[p.id]} R\nBal: {balances[p.id]}", color=discord.Color.from_rgb(255, 182, 193))
             await self.cog._notify_wallet_thread(p, rec)
 
 async def setup(bot):
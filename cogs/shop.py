@@ -1,86 +1,70 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
-import aiosqlite
-import os
 import datetime
-from utils import load_data, PROFILE_FILE 
+from services.bulk_delete import delete_messages
+from services.purchases import MAX_LINE_QUANTITY
 
-DB_NAME = 'school_data.db'
 CURRENCY_SYMBOL = "R"
 SHOP_LOGO = "https://iili.io/f3RXjgp.png"
 SHOP_ADMIN_ROLES = ["Empress of TRA", "Commerce Handler", "Shop Keeper"]
 SUPERVISOR_ROLES = ["Empress of TRA", "Commerce Handler"]
+CART_QUANTITIES = [1, 2, 3, 5, 10, MAX_LINE_QUANTITY]
+CART_MAX_LINES = 10
 
 class Shop(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.db_path = os.path.join(os.getcwd(), DB_NAME)
-
-    async def cog_load(self):
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute("CREATE TABLE IF NOT EXISTS shop_items (id INTEGER PRIMARY KEY, name TEXT UNIQUE, price INTEGER, description TEXT, image_url TEXT, stock INTEGER DEFAULT -1, shop_name TEXT DEFAULT 'General Store')")
-            await db.execute("CREATE TABLE IF NOT EXISTS inventory (id INTEGER PRIMARY KEY, user_id INTEGER, item_name TEXT, amount INTEGER DEFAULT 1)")
-            await db.execute("CREATE TABLE IF NOT EXISTS sales_history (id INTEGER PRIMARY KEY, user_id INTEGER, user_name TEXT, item_name TEXT, price INTEGER, timestamp TEXT, shop_name TEXT DEFAULT 'Unknown')")
-            await db.execute("CREATE TABLE IF NOT EXISTS active_displays (id INTEGER PRIMARY KEY, item_name TEXT, channel_id INTEGER, message_id INTEGER)")
-            await db.commit()
+        self.db = bot.db
+        self.catalog = bot.catalog
 
     async def _notify(self, user, embed):
-        try:
-            p = load_data(PROFILE_FILE)
-            wid = p.get(str(user.id), {}).get('wallet_thread_id')
-            if wid:
-                ch = self.bot.get_channel(int(wid))
-                if ch: await ch.send(embed=embed)
-        except: pass
+        await self.bot.outbox.enqueue(user, embed)
 
     @app_commands.command(name="shop_add")
     async def add(self, interaction, name: str, shop_name: str, price: int, description: str, image_url: str = None, stock: int = -1):
         if not any(r.name in SHOP_ADMIN_ROLES for r in interaction.user.roles): return await interaction.response.send_message("❌ ไม่มีสิทธิ์", ephemeral=True)
-        async with aiosqlite.connect(self.db_path) as db:
-            try:
-                await db.execute("INSERT INTO shop_items (name, shop_name, price, description, image_url, stock) VALUES (?,?,?,?,?,?)", (name, shop_name, price, description, image_url, stock))
-                await db.commit()
-                await interaction.response.send_message(f"✅ เพิ่มสินค้า **{name}** แล้ว", ephemeral=True)
-            except: await interaction.response.send_message("❌ มีสินค้านี้แล้ว", ephemeral=True)
+        if await self.catalog.add(name, shop_name, price, description, image_url, stock):
+            await interaction.response.send_message(f"✅ เพิ่มสินค้า **{name}** แล้ว", ephemeral=True)
+        else: await interaction.response.send_message("❌ มีสินค้านี้แล้ว", ephemeral=True)
 
     @app_commands.command(name="shop_restock")
     async def restock(self, interaction, name: str, amount: int):
         if not any(r.name in SHOP_ADMIN_ROLES for r in interaction.user.roles): return await interaction.response.send_message("❌ ไม่มีสิทธิ์", ephemeral=True)
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute("UPDATE shop_items SET stock = stock + ? WHERE name = ?", (amount, name))
-            await db.commit()
+        if await self.catalog.restock(name, amount) is None: return await interaction.response.send_message("❌ ไม่พบสินค้านี้", ephemeral=True)
         await interaction.response.send_message(f"📦 เติมสต็อก {name} +{amount}", ephemeral=True)
 
     @app_commands.command(name="shop_remove")
     async def remove(self, interaction, name: str):
         if not any(r.name in SHOP_ADMIN_ROLES for r in interaction.user.roles): return await interaction.response.send_message("❌ ไม่มีสิทธิ์", ephemeral=True)
         await interaction.response.defer(ephemeral=True)
-        async with aiosqlite.connect(self.db_path) as db:
-            # Delete Displays
-            async with db.execute("SELECT channel_id, message_id FROM active_displays WHERE item_name=?", (name,)) as c:
-                displays = await c.fetchall()
-            for cid, mid in displays:
-                try: await (self.bot.get_channel(cid).get_partial_message(mid)).delete()
-                except: pass
-            
-            await db.execute("DELETE FROM active_displays WHERE item_name=?", (name,))
-            await db.execute("DELETE FROM inventory WHERE item_name=?", (name,))
-            await db.execute("DELETE FROM shop_items WHERE name=?", (name,))
-            await db.commit()
-        await interaction.followup.send(f"🗑️ ลบสินค้า {name} และข้อมูลที่เกี่ยวข้องแล้ว", ephemeral=True)
+        # Delete Displays
+        displays = await self.db.fetchall("SELECT channel_id, message_id FROM active_displays WHERE item_name=?", (name,))
+        report = await delete_messages(self.bot, [(cid, mid) for cid, mid in displays])
+        
+        await self.catalog.remove(name)
+        self.bot.item_index.drop_item(name)
+        summary = f"ลบข้อความโชว์ {report['deleted']}/{len(displays)}"
+        if report['failed']: summary += f" (ลบไม่ได้ {report['failed']})"
+        await interaction.followup.send(f"🗑️ ลบสินค้า {name} และข้อมูลที่เกี่ยวข้องแล้ว\n{summary}", ephemeral=True)
 
     @app_commands.command(name="shop")
     async def shop(self, interaction):
-        async with aiosqlite.connect(self.db_path) as db:
-            async with db.execute("SELECT DISTINCT shop_name FROM shop_items") as c: shops = [r[0] for r in await c.fetchall()]
+        shops = self.catalog.shops()
         
         if not shops: return await interaction.response.send_message("ร้านค้าปิดปรับปรุง", ephemeral=True)
-        view = ShopSelectView(shops, self.db_path, self._notify)
+        view = ShopSelectView(shops, self.bot, self._notify)
         embed = discord.Embed(title="🛒 Shopping Center", description="เลือกร้านค้าด้านล่าง", color=discord.Color.gold())
         embed.set_thumbnail(url=SHOP_LOGO)
         await interaction.response.send_message(embed=embed, view=view)
 
+    @app_commands.command(name="cart", description="เลือกสินค้าหลายชิ้นใส่ตะกร้าแล้วจ่ายทีเดียว")
+    async def cart(self, interaction):
+        shops = self.catalog.shops()
+        if not shops: return await interaction.response.send_message("ร้านค้าปิดปรับปรุง", ephemeral=True)
+        view = CartView(shops, self.bot, self._notify)
+        await interaction.response.send_message(embed=view.render(), view=view, ephemeral=True)
+
     @app_commands.command(name="buy")
     async def buy_cmd(self, interaction):
         await self.shop.callback(interaction) # Reuse logic
@@ -88,97 +72,183 @@ class Shop(commands.Cog):
     @app_commands.command(name="sales_history")
     async def history(self, interaction):
         if not any(r.name in SUPERVISOR_ROLES for r in interaction.user.roles): return await interaction.response.send_message("❌ ไม่มีสิทธิ์", ephemeral=True)
-        async with aiosqlite.connect(self.db_path) as db:
-            async with db.execute("SELECT user_name, item_name, price, timestamp, shop_name FROM sales_history ORDER BY id DESC LIMIT 50") as c:
-                logs = await c.fetchall()
+        logs = await self.db.fetchall("SELECT user_name, item_name, price, quantity, timestamp, shop_name FROM sales_history ORDER BY id DESC LIMIT 50")
         
         txt = ""
-        for u, i, p, t, s in logs:
+        for u, i, p, q, t, s in logs:
             dt = datetime.datetime.fromisoformat(t).strftime("%d/%m %H:%M")
-            txt += f"`{dt}`: **{u}** ซื้อ **{i}** ({p} R) จาก {s}\n"
+            qty = f" x{q}" if q > 1 else ""
+            txt += f"`{dt}`: **{u}** ซื้อ **{i}**{qty} ({p * q} R) จาก {s}\n"
         
         await interaction.response.send_message(embed=discord.Embed(title="📜 Sales History", description=txt or "ว่างเปล่า", color=discord.Color.orange()), ephemeral=True)
 
+    @app_commands.command(name="shop_stats", description="[STAFF] สถิติการซื้อต่อสินค้า (ตั้งแต่บอทเริ่ม)")
+    async def shop_stats(self, interaction):
+        if not any(r.name in SUPERVISOR_ROLES for r in interaction.user.roles): return await interaction.response.send_message("❌ ไม่มีสิทธิ์", ephemeral=True)
+        stats = sorted(self.bot.purchases.stats().items(), key=lambda kv: kv[1]['requests'], reverse=True)[:15]
+
+        txt = ""
+        for name, s in stats:
+            rate = f"{s['per_second']:.1f} ชิ้น/วิ" if s['per_second'] is not None else "— ชิ้น/วิ"
+            txt += f"**{name}**: ขาย {s['sold']} / คำขอ {s['requests']} (ของหมด {s['sold_out']}, เงินไม่พอ {s['no_funds']}) · {s['batches']} commits · {rate}\n"
+        await interaction.response.send_message(embed=discord.Embed(title="📈 Shop Stats", description=txt or "ยังไม่มีการซื้อ", color=discord.Color.orange()), ephemeral=True)
+
 class ShopSelectView(discord.ui.View):
-    def __init__(self, shops, db, notify):
+    def __init__(self, shops, bot, notify):
         super().__init__()
-        self.add_item(ShopSelect(shops, db, notify))
+        self.shops = shops
+        self.bot = bot
+        self.notify = notify
+        self.add_item(ShopSelect(shops, bot, notify))
+
+    @discord.ui.button(label="ตะกร้า", emoji="🛒", style=discord.ButtonStyle.secondary, row=1)
+    async def open_cart(self, interaction, button):
+        # ตะกร้าแยกต่อคน (ข้อความ ephemeral) ข้อความร้านค้าหลักยังใช้ร่วมกันได้
+        view = CartView(self.shops, self.bot, self.notify)
+        await interaction.response.send_message(embed=view.render(), view=view, ephemeral=True)
 
 class ShopSelect(discord.ui.Select):
-    def __init__(self, shops, db, notify):
-        self.db = db
+    def __init__(self, shops, bot, notify):
+        self.bot = bot
         self.notify = notify
         options = [discord.SelectOption(label=s, value=s, emoji="🛖") for s in shops]
         super().__init__(placeholder="เลือกร้าน...", options=options)
 
     async def callback(self, interaction):
         shop = self.values[0]
-        async with aiosqlite.connect(self.db) as db:
-            async with db.execute("SELECT name, price, stock, description FROM shop_items WHERE shop_name=?", (shop,)) as c:
-                items = await c.fetchall()
+        items = self.bot.catalog.items(shop)
         
         if not items: return await interaction.response.send_message("ไม่มีสินค้า", ephemeral=True)
-        view = ItemSelectView(items, shop, self.db, self.notify)
+        view = ItemSelectView(items, shop, self.bot, self.notify)
         await interaction.response.edit_message(embed=discord.Embed(title=f"🛖 {shop}", description="เลือกสินค้าที่จะซื้อ", color=discord.Color.gold()), view=view)
 
 class ItemSelectView(discord.ui.View):
-    def __init__(self, items, shop, db, notify):
+    def __init__(self, items, shop, bot, notify):
         super().__init__()
-        self.add_item(ItemSelect(items, shop, db, notify))
+        self.add_item(ItemSelect(items, shop, bot, notify))
 
 class ItemSelect(discord.ui.Select):
-    def __init__(self, items, shop, db, notify):
-        self.db = db
+    def __init__(self, items, shop, bot, notify):
+        self.bot = bot
         self.notify = notify
         self.shop = shop
         options = []
-        for n, p, s, d in items[:25]:
-            stock = "♾️" if s == -1 else f"{s} ชิ้น"
-            options.append(discord.SelectOption(label=f"{n} ({p} R)", description=f"Stock: {stock}", value=n))
+        for item in items[:25]:
+            stock = "♾️" if item['stock'] == -1 else f"{item['stock']} ชิ้น"
+            options.append(discord.SelectOption(label=f"{item['name']} ({item['price']} R)", description=f"Stock: {stock}", value=item['name']))
         super().__init__(placeholder="เลือกสินค้า...", options=options)
 
     async def callback(self, interaction):
         name = self.values[0]
-        async with aiosqlite.connect(self.db) as db:
-            # Check item
-            async with db.execute("SELECT id, price, stock, image_url FROM shop_items WHERE name=?", (name,)) as c:
-                item = await c.fetchone()
-            if not item: return await interaction.response.send_message("สินค้าหมด/ถูกลบ", ephemeral=True)
-            iid, price, stock, img = item
-
-            if stock != -1 and stock <= 0: return await interaction.response.send_message("สินค้าหมด", ephemeral=True)
-
-            # Check money
-            async with db.execute("SELECT balance FROM royals WHERE user_id=?", (interaction.user.id,)) as c:
-                res = await c.fetchone()
-                bal = res[0] if res else 0
-            if bal < price: return await interaction.response.send_message("เงินไม่พอ", ephemeral=True)
-
-            # Transact
-            await db.execute("UPDATE royals SET balance=balance-? WHERE user_id=?", (price, interaction.user.id))
-            if stock != -1: await db.execute("UPDATE shop_items SET stock=stock-1 WHERE id=?", (iid,))
-            
-            # Add inventory
-            async with db.execute("SELECT amount FROM inventory WHERE user_id=? AND item_name=?", (interaction.user.id, name)) as c:
-                has = await c.fetchone()
-            if has: await db.execute("UPDATE inventory SET amount=amount+1 WHERE user_id=? AND item_name=?", (interaction.user.id, name))
-            else: await db.execute("INSERT INTO inventory (user_id, item_name, amount) VALUES (?,?,1)", (interaction.user.id, name))
-            
-            # Log
-            await db.execute("INSERT INTO sales_history (user_id, user_name, item_name, price, timestamp, shop_name) VALUES (?,?,?,?,?,?)", 
-                             (interaction.user.id, interaction.user.display_name, name, price, datetime.datetime.now().isoformat(), self.shop))
-            await db.commit()
-
-            embed = discord.Embed(description=f"🛍️ ซื้อ **{name}** สำเร็จ!", color=discord.Color.green())
-            if img: embed.set_thumbnail(url=img)
-            await interaction.response.edit_message(embed=embed, view=None)
-
-            # Notify
-            rec = discord.Embed(title="🧾 ใบเสร็จ", color=discord.Color.gold())
-            rec.add_field(name="สินค้า", value=name)
-            rec.add_field(name="ราคา", value=f"{price} R")
-            if img: rec.set_thumbnail(url=img)
-            await self.notify(interaction.user, rec)
+        # จองสต็อก + หักเงินแบบมีเงื่อนไขผ่านคิวของสินค้านั้น (กันขายเกินตอนคนแย่งกันซื้อ)
+        result = await self.bot.purchases.buy(interaction.user, name)
+        if isinstance(result, str): return await interaction.response.send_message(result, ephemeral=True)
+        price, img, bal, stock, _ = result
+
+        embed = discord.Embed(description=f"🛍️ ซื้อ **{name}** สำเร็จ!", color=discord.Color.green())
+        if img: embed.set_thumbnail(url=img)
+        await interaction.response.edit_message(embed=embed, view=None)
+
+        # Notify
+        rec = discord.Embed(title="🧾 ใบเสร็จ", color=discord.Color.gold())
+        rec.add_field(name="สินค้า", value=name)
+        rec.add_field(name="ราคา", value=f"{price} R")
+        if img: rec.set_thumbnail(url=img)
+        await self.notify(interaction.user, rec)
+
+class CartView(discord.ui.View):
+    """ตะกร้าของผู้ใช้หนึ่งคน: เลือกร้าน → สินค้า → จำนวน แล้วกดเพิ่ม จ่ายครั้งเดียวตอน checkout"""
+
+    def __init__(self, shops, bot, notify):
+        super().__init__(timeout=600)
+        self.bot = bot
+        self.notify = notify
+        self.cart = {} # item_name -> quantity
+        self.selected_item = None
+        self.quantity = 1
+        self.checking_out = False # กันกดชำระซ้ำระหว่างรอผล (จะตัดเงินซ้ำทั้งตะกร้า)
+
+        self.shop_select = discord.ui.Select(placeholder="เลือกร้าน...", options=[discord.SelectOption(label=s, value=s, emoji="🛖") for s in shops[:25]], row=0)
+        self.shop_select.callback = self.on_shop
+        self.item_select = discord.ui.Select(placeholder="เลือกร้านก่อน", options=[discord.SelectOption(label="-", value="-")], disabled=True, row=1)
+        self.item_select.callback = self.on_item
+        self.qty_select = discord.ui.Select(placeholder="จำนวน: 1", options=[discord.SelectOption(label=f"x{q}", value=str(q)) for q in CART_QUANTITIES], row=2)
+        self.qty_select.callback = self.on_quantity
+        for item in (self.shop_select, self.item_select, self.qty_select): self.add_item(item)
+
+    def render(self):
+        embed = discord.Embed(title="🛒 ตะกร้าสินค้า", color=discord.Color.gold())
+        total = 0
+        lines = []
+        for name, qty in self.cart.items():
+            item = self.bot.catalog.get(name)
+            price = item['price'] if item else 0
+            total += price * qty
+            lines.append(f"• **{name}** x{qty} = {price * qty:,} {CURRENCY_SYMBOL}")
+        embed.description = "\n".join(lines) or "ยังไม่มีสินค้าในตะกร้า"
+        embed.add_field(name="รวม", value=f"{total:,} {CURRENCY_SYMBOL}")
+        if self.selected_item: embed.set_footer(text=f"เลือกอยู่: {self.selected_item} x{self.quantity}")
+        return embed
+
+    async def on_shop(self, interaction):
+        items = self.bot.catalog.items(self.shop_select.values[0])[:25]
+        if not items: return await interaction.response.send_message("ไม่มีสินค้า", ephemeral=True)
+        self.item_select.options = [discord.SelectOption(label=f"{i['name']} ({i['price']} R)", value=i['name'], description=f"Stock: {'♾️' if i['stock'] == -1 else i['stock']}") for i in items]
+        self.item_select.placeholder = "เลือกสินค้า..."
+        self.item_select.disabled = False
+        await interaction.response.edit_message(embed=self.render(), view=self)
+
+    async def on_item(self, interaction):
+        self.selected_item = self.item_select.values[0]
+        await interaction.response.edit_message(embed=self.render(), view=self)
+
+    async def on_quantity(self, interaction):
+        self.quantity = int(self.qty_select.values[0])
+        self.qty_select.placeholder = f"จำนวน: {self.quantity}"
+        await interaction.response.edit_message(embed=self.render(), view=self)
+
+    @discord.ui.button(label="เพิ่ม", emoji="➕", style=discord.ButtonStyle.primary, row=3)
+    async def add(self, interaction, button):
+        if not self.selected_item: return await interaction.response.send_message("เลือกสินค้าก่อน", ephemeral=True)
+        if self.selected_item not in self.cart and len(self.cart) >= CART_MAX_LINES:
+            return await interaction.response.send_message(f"ตะกร้าใส่ได้สูงสุด {CART_MAX_LINES} รายการ", ephemeral=True)
+        quantity = self.cart.get(self.selected_item, 0) + self.quantity
+        if quantity > MAX_LINE_QUANTITY:
+            return await interaction.response.send_message(f"สินค้าชิ้นเดียวกันใส่ตะกร้าได้สูงสุด {MAX_LINE_QUANTITY} ชิ้น", ephemeral=True)
+        self.cart[self.selected_item] = quantity
+        await interaction.response.edit_message(embed=self.render(), view=self)
+
+    @discord.ui.button(label="ล้าง", emoji="🗑️", style=discord.ButtonStyle.secondary, row=3)
+    async def clear(self, interaction, button):
+        self.cart.clear()
+        await interaction.response.edit_message(embed=self.render(), view=self)
+
+    @discord.ui.button(label="ชำระเงิน", emoji="✅", style=discord.ButtonStyle.success, row=3)
+    async def checkout(self, interaction, button):
+        if self.checking_out: return await interaction.response.defer()
+        if not self.cart: return await interaction.response.send_message("ตะกร้าว่าง", ephemeral=True)
+        self.checking_out = True
+        try: result = await self.bot.purchases.checkout(interaction.user, self.cart)
+        except Exception:
+            self.checking_out = False
+            raise
+        if isinstance(result, str):
+            self.checking_out = False # ไม่มีอะไรถูกตัด แก้ตะกร้าแล้วกดใหม่ได้
+            return await interaction.response.send_message(f"❌ {result}", ephemeral=True)
+        self.stop()
+        bought, bal = result
+
+        total = sum(price * qty for _, qty, price, _, _ in bought)
+        lines = "\n".join(f"• **{name}** x{qty} ({price * qty:,} {CURRENCY_SYMBOL})" for name, qty, price, _, _ in bought)
+        await interaction.response.edit_message(embed=discord.Embed(description=f"🛍️ ซื้อสำเร็จ {len(bought)} รายการ!\n{lines}", color=discord.Color.green()), view=None)
+
+        # ใบเสร็จเดียวรวมทุกรายการ
+        rec = discord.Embed(title="🧾 ใบเสร็จ", description=lines, color=discord.Color.gold())
+        rec.add_field(name="รวม", value=f"{total:,} {CURRENCY_SYMBOL}")
+        rec.add_field(name="คงเหลือ", value=f"{bal:,} {CURRENCY_SYMBOL}")
+        img = next((img for _, _, _, img, _ in bought if img), None)
+        if img: rec.set_thumbnail(url=img)
+        await self.notify(interaction.user, rec)
 
 async def setup(bot):
     await bot.add_cog(Shop(bot))
@@ -0,0 +1,125 @@
+import datetime
+import os
+
+# --- ⚙️ การตั้งค่า ---
+ARCHIVE_HORIZON_DAYS = 180      # แถวเก่ากว่านี้ถูกย้ายออกจากตารางหลัก
+ACTIVITY_LOG_HORIZON_DAYS = 56  # activity_logs ใช้แค่ตรวจโควตารายสัปดาห์ (ยอดอยู่ใน activity_quota แล้ว)
+ARCHIVE_DB_PATH = os.getenv('ARCHIVE_DB_PATH') # ถ้าตั้งไว้ จะคัดลอกแถวดิบไปเก็บในไฟล์นี้ก่อนลบ
+
+# ตาราง -> (จำนวนวันที่เก็บไว้, SQL สรุปรายเดือนที่บวกเข้าตาราง *_monthly)
+# ยอดเงิน (royals) ไม่ได้คำนวณจากตารางเหล่านี้ จึงไม่เปลี่ยนหลังย้าย
+ROLLUPS = {
+    'transactions': (ARCHIVE_HORIZON_DAYS, [
+        """
+        INSERT INTO transactions_monthly (month, user_id, type, sent_count, sent_amount)
+        SELECT strftime('%Y-%m', timestamp), source_id, type, COUNT(*), SUM(amount) FROM transactions
+        WHERE timestamp < ? GROUP BY 1, 2, 3
+        ON CONFLICT(month, user_id, type) DO UPDATE SET sent_count = sent_count + excluded.sent_count, sent_amount = sent_amount + excluded.sent_amount
+        """,
+        """
+        INSERT INTO transactions_monthly (month, user_id, type, received_count, received_amount)
+        SELECT strftime('%Y-%m', timestamp), target_id, type, COUNT(*), SUM(amount) FROM transactions
+        WHERE timestamp < ? GROUP BY 1, 2, 3
+        ON CONFLICT(month, user_id, type) DO UPDATE SET received_count = received_count + excluded.received_count, received_amount = received_amount + excluded.received_amount
+        """,
+    ]),
+    'sales_history': (ARCHIVE_HORIZON_DAYS, [
+        """
+        INSERT INTO sales_monthly (month, user_id, item_name, purchases, spent)
+        SELECT strftime('%Y-%m', timestamp), user_id, item_name, SUM(quantity), SUM(price * quantity) FROM sales_history
+        WHERE timestamp < ? GROUP BY 1, 2, 3
+        ON CONFLICT(month, user_id, item_name) DO UPDATE SET purchases = purchases + excluded.purchases, spent = spent + excluded.spent
+        """,
+    ]),
+    'rp_rewards': (ARCHIVE_HORIZON_DAYS, [
+        """
+        INSERT INTO rp_rewards_monthly (month, user_id, posts, earned)
+        SELECT strftime('%Y-%m', timestamp), user_id, COUNT(*), SUM(amount) FROM rp_rewards
+        WHERE timestamp < ? GROUP BY 1, 2
+        ON CONFLICT(month, user_id) DO UPDATE SET posts = posts + excluded.posts, earned = earned + excluded.earned
+        """,
+    ]),
+    'activity_logs': (ACTIVITY_LOG_HORIZON_DAYS, [
+        """
+        INSERT INTO activity_monthly (month, user_id, activity_type, count)
+        SELECT strftime('%Y-%m', timestamp), user_id, activity_type, COUNT(*) FROM activity_logs
+        WHERE timestamp < ? GROUP BY 1, 2, 3
+        ON CONFLICT(month, user_id, activity_type) DO UPDATE SET count = count + excluded.count
+        """,
+    ]),
+}
+
+# คอลัมน์ที่คัดลอกไปไฟล์ archive (ระบุชื่อเสมอ ไฟล์เก่าที่ยังไม่มีคอลัมน์ใหม่จะถูก ADD COLUMN ให้)
+ARCHIVE_COLUMNS = {
+    'transactions': ('id', 'timestamp', 'type', 'source_id', 'target_id', 'amount'),
+    'sales_history': ('id', 'timestamp', 'user_id', 'user_name', 'item_name', 'price', 'quantity', 'shop_name'),
+    'rp_rewards': ('message_id', 'timestamp', 'user_id', 'amount'),
+    'activity_logs': ('id', 'timestamp', 'user_id', 'activity_type'),
+}
+
+class Archiver:
+    """ย้ายแถวเก่าของตาราง append-only ไปเป็นยอดสรุปรายเดือน (ต่อ user ต่อประเภท) แล้วคืนพื้นที่ไฟล์"""
+
+    def __init__(self, db, archive_path: str = ARCHIVE_DB_PATH):
+        self.db = db
+        self.archive_path = archive_path
+
+    async def _db_bytes(self) -> int:
+        pages = await self.db.fetchval("PRAGMA page_count", default=0)
+        return pages * await self.db.fetchval("PRAGMA page_size", default=4096)
+
+    async def run(self, now: datetime.datetime = None) -> dict:
+        """คืนรายงาน: จำนวนแถวที่ย้ายต่อตาราง และขนาดไฟล์ก่อน/หลัง (ไบต์)"""
+        now = now or datetime.datetime.utcnow()
+        before = await self._db_bytes()
+        attached = bool(self.archive_path)
+        if attached:
+            await self.db.maintenance(self._attach, self.archive_path)
+
+        moved = {}
+        try:
+            for table, (days, rollups) in ROLLUPS.items():
+                cutoff = (now - datetime.timedelta(days=days)).isoformat()
+                moved[table] = await self.db.write(self._archive_table, table, rollups, cutoff, attached)
+        finally:
+            if attached: await self.db.maintenance(self._detach)
+
+        await self.db.maintenance(self._vacuum)
+        after = await self._db_bytes()
+        return {'moved': moved, 'before': before, 'after': after, 'reclaimed': max(0, before - after)}
+
+    @staticmethod
+    async def _attach(conn, path):
+        await conn.execute("ATTACH DATABASE ? AS archive", (path,))
+
+    @staticmethod
+    async def _detach(conn):
+        await conn.execute("DETACH DATABASE archive")
+
+    @staticmethod
+    async def _archive_table(conn, table, rollups, cutoff, attached):
+        for sql in rollups:
+            await conn.execute(sql, (cutoff,))
+        if attached:
+            columns = ARCHIVE_COLUMNS[table]
+            await conn.execute(f"CREATE TABLE IF NOT EXISTS archive.{table} ({', '.join(columns)})")
+            async with conn.execute(f"PRAGMA archive.table_info({table})") as c:
+                existing = {row[1] for row in await c.fetchall()}
+            for col in columns:
+                if col not in existing: await conn.execute(f"ALTER TABLE archive.{table} ADD COLUMN {col}")
+            cols = ', '.join(columns)
+            await conn.execute(f"INSERT INTO archive.{table} ({cols}) SELECT {cols} FROM main.{table} WHERE timestamp < ?", (cutoff,))
+        async with conn.execute(f"DELETE FROM main.{table} WHERE timestamp < ?", (cutoff,)) as c:
+            return c.rowcount
+
+    @staticmethod
+    async def _vacuum(conn):
+        async with conn.execute("PRAGMA auto_vacuum") as c:
+            mode = (await c.fetchone())[0]
+        if mode != 2:
+            # เปลี่ยนเป็น INCREMENTAL ครั้งแรกต้อง VACUUM เต็มหนึ่งรอบ
+            await conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            await conn.execute("VACUUM")
+        else:
+            async with conn.execute("PRAGMA incremental_vacuum") as c: await c.fetchall()
+        async with conn.execute("PRAGMA wal_checkpoint(TRUNCATE)") as c: await c.fetchall()
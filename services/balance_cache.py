@@ -0,0 +1,57 @@
+from collections import OrderedDict
+
+MAX_CACHED_BALANCES = 5000
+
+class BalanceCache:
+    """แคชยอดเงิน (royals.balance) ใน memory แบบ LRU โหลดจาก SQLite เมื่อไม่เจอเท่านั้น
+    ยอดใหม่ถูกเขียนทับผ่าน Ledger หลัง commit (write-through)
+    """
+
+    def __init__(self, db, max_size: int = MAX_CACHED_BALANCES):
+        self.db = db
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict = OrderedDict()
+        self._loading = {} # user_id -> token ของการโหลดที่กำลังรอ (ถูกลบเมื่อมีการเขียนระหว่างโหลด)
+
+    def __len__(self):
+        return len(self._data)
+
+    async def get(self, user_id: int) -> int:
+        if user_id in self._data:
+            self.hits += 1
+            self._data.move_to_end(user_id)
+            return self._data[user_id]
+
+        self.misses += 1
+        token = object()
+        self._loading[user_id] = token
+        bal = await self.db.fetchval("SELECT balance FROM royals WHERE user_id = ?", (user_id,), 0)
+        # ถ้ามีการเขียนยอดใหม่เข้ามาระหว่างรอ DB ค่าที่อ่านได้อาจเก่าแล้ว จึงไม่เก็บลงแคช
+        if self._loading.get(user_id) is token:
+            del self._loading[user_id]
+            self._store(user_id, bal)
+        return self._data.get(user_id, bal)
+
+    def set(self, user_id: int, balance: int):
+        self._loading.pop(user_id, None)
+        self._store(user_id, balance)
+
+    def invalidate(self, user_id: int = None):
+        if user_id is None:
+            self._loading.clear()
+            self._data.clear()
+            return
+        self._loading.pop(user_id, None)
+        self._data.pop(user_id, None)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {'size': len(self._data), 'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / total if total else 0.0}
+
+    def _store(self, user_id: int, balance: int):
+        self._data[user_id] = balance
+        self._data.move_to_end(user_id)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
@@ -0,0 +1,73 @@
+import asyncio
+import time
+import discord
+
+# --- ⚙️ การตั้งค่า ---
+BULK_DELETE_CONCURRENCY = 8
+BULK_DELETE_CHUNK = 100                      # ลิมิตของ Discord bulk delete ต่อครั้ง
+BULK_DELETE_MAX_AGE = 14 * 86400 - 3600      # Discord ลบแบบ bulk ได้เฉพาะข้อความอายุไม่เกิน 14 วัน
+DISCORD_EPOCH_MS = 1420070400000
+
+def _age(snowflake: int) -> float:
+    return time.time() - ((snowflake >> 22) + DISCORD_EPOCH_MS) / 1000
+
+async def _resolve_channel(bot, channel_id: int):
+    """ใช้ cache ก่อน ถ้าไม่มี (เช่นเธรดที่ archive แล้ว) ค่อย fetch"""
+    return bot.get_channel(channel_id) or await bot.fetch_channel(channel_id)
+
+async def _run(semaphore, report, coro_factory, count: int = 1):
+    async with semaphore:
+        try:
+            await coro_factory()
+            report['deleted'] += count
+        except discord.NotFound: report['missing'] += count
+        except discord.HTTPException: report['failed'] += count
+
+async def delete_messages(bot, targets, concurrency: int = BULK_DELETE_CONCURRENCY) -> dict:
+    """ลบข้อความจาก [(channel_id, message_id)] คืน {'deleted', 'missing', 'failed'}
+    ข้อความที่อายุไม่เกิน 14 วันในห้องเดียวกันถูกลบเป็นชุดละ 100 ที่เหลือลบทีละข้อความพร้อมกันไม่เกิน concurrency
+    """
+    report = {'deleted': 0, 'missing': 0, 'failed': 0}
+    semaphore = asyncio.Semaphore(concurrency)
+    by_channel = {}
+    for channel_id, message_id in targets:
+        by_channel.setdefault(channel_id, []).append(message_id)
+
+    async def clear_channel(channel_id, message_ids):
+        try: channel = await _resolve_channel(bot, channel_id)
+        except discord.NotFound:
+            report['missing'] += len(message_ids)
+            return
+        except discord.HTTPException:
+            report['failed'] += len(message_ids)
+            return
+
+        recent = [mid for mid in message_ids if _age(mid) < BULK_DELETE_MAX_AGE]
+        single = [mid for mid in message_ids if _age(mid) >= BULK_DELETE_MAX_AGE]
+        for i in range(0, len(recent), BULK_DELETE_CHUNK):
+            chunk = recent[i:i + BULK_DELETE_CHUNK]
+            if len(chunk) < 2 or not hasattr(channel, 'delete_messages'):
+                single += chunk
+                continue
+            try:
+                async with semaphore: await channel.delete_messages([discord.Object(mid) for mid in chunk])
+                report['deleted'] += len(chunk)
+            except discord.HTTPException:
+                single += chunk # ไม่มีสิทธิ์ Manage Messages หรือมีข้อความที่หายไปแล้ว: ลบทีละข้อความแทน
+
+        await asyncio.gather(*[_run(semaphore, report, channel.get_partial_message(mid).delete) for mid in single])
+
+    await asyncio.gather(*[clear_channel(cid, mids) for cid, mids in by_channel.items()])
+    return report
+
+async def delete_channels(bot, channel_ids, concurrency: int = BULK_DELETE_CONCURRENCY) -> dict:
+    """ลบห้อง/เธรดหลายห้องพร้อมกัน (id ที่เป็น None ถูกข้าม) คืน {'deleted', 'missing', 'failed'}"""
+    report = {'deleted': 0, 'missing': 0, 'failed': 0}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def delete(channel_id):
+        channel = await _resolve_channel(bot, channel_id)
+        await channel.delete()
+
+    await asyncio.gather(*[_run(semaphore, report, lambda cid=cid: delete(cid)) for cid in channel_ids if cid])
+    return report
@@ -0,0 +1,58 @@
+import sqlite3
+
+ITEM_COLUMNS = ('id', 'name', 'price', 'stock', 'description', 'image_url', 'shop_name')
+
+class ShopCatalog:
+    """สินค้าทั้งหมด (shop_items) ใน memory: หน้าเลือกร้าน/สินค้าไม่ต้องแตะ SQLite
+    ทุกการแก้ไขเขียนลง DB ก่อน แล้วอัปเดต memory ด้วยค่าที่ commit แล้วเท่านั้น
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._items = {} # name -> dict ตาม ITEM_COLUMNS
+
+    async def load(self):
+        rows = await self.db.fetchall(f"SELECT {', '.join(ITEM_COLUMNS)} FROM shop_items ORDER BY id")
+        self._items = {row['name']: dict(zip(ITEM_COLUMNS, row)) for row in rows}
+
+    def shops(self):
+        return list(dict.fromkeys(item['shop_name'] for item in self._items.values()))
+
+    def items(self, shop_name: str):
+        return [item for item in self._items.values() if item['shop_name'] == shop_name]
+
+    def get(self, name: str):
+        return self._items.get(name)
+
+    def set_stock(self, name: str, stock: int):
+        """เรียกหลัง commit ที่เปลี่ยนสต็อก (เช่นการซื้อ)"""
+        if name in self._items: self._items[name]['stock'] = stock
+
+    # --- ✍️ คำสั่งแอดมิน (เขียน DB แล้วค่อยอัปเดต memory) ---
+    async def add(self, name: str, shop_name: str, price: int, description: str, image_url: str = None, stock: int = -1) -> bool:
+        async def insert(db):
+            async with db.execute("INSERT INTO shop_items (name, shop_name, price, description, image_url, stock) VALUES (?,?,?,?,?,?) RETURNING id",
+                                  (name, shop_name, price, description, image_url, stock)) as c:
+                return (await c.fetchone())[0]
+        try: iid = await self.db.write(insert)
+        except sqlite3.IntegrityError: return False
+        self._items[name] = {'id': iid, 'name': name, 'price': price, 'stock': stock, 'description': description, 'image_url': image_url, 'shop_name': shop_name}
+        return True
+
+    async def restock(self, name: str, amount: int):
+        """คืนสต็อกใหม่ หรือ None ถ้าไม่มีสินค้านี้"""
+        async def update(db):
+            async with db.execute("UPDATE shop_items SET stock = stock + ? WHERE name = ? RETURNING stock", (amount, name)) as c:
+                row = await c.fetchone()
+            return row[0] if row else None
+        stock = await self.db.write(update)
+        if stock is not None: self.set_stock(name, stock)
+        return stock
+
+    async def remove(self, name: str):
+        async def delete(db):
+            await db.execute("DELETE FROM active_displays WHERE item_name=?", (name,))
+            await db.execute("DELETE FROM inventory WHERE item_name=?", (name,))
+            await db.execute("DELETE FROM shop_items WHERE name=?", (name,))
+        await self.db.write(delete)
+        self._items.pop(name, None)
@@ -0,0 +1,92 @@
+import asyncio
+import heapq
+import time
+
+# --- ⚙️ การตั้งค่า ---
+MAX_COOLDOWNS = 20000    # จำนวนคูลดาวน์สูงสุดใน memory (เกินแล้วทิ้งอันที่ใกล้หมดเวลาที่สุด)
+SNAPSHOT_INTERVAL = 30.0 # วินาที: บันทึกคูลดาวน์ที่เปลี่ยนลง SQLite
+
+class CooldownStore:
+    """คูลดาวน์แบบหมดอายุเองใช้ร่วมกันทุก Cog: key = (namespace, id) เช่น ('rp_post', user_id)
+    เก็บเวลาหมดอายุ (epoch) ใน memory + heap ตามเวลาหมดอายุ อันที่หมดแล้วถูกทิ้งทันทีที่มีการใช้งาน
+    บันทึกลงตาราง cooldowns เป็นระยะและโหลดกลับตอนบอทเริ่ม (รีสตาร์ทแล้วคูลดาวน์ไม่หาย)
+    """
+
+    def __init__(self, db, max_size: int = MAX_COOLDOWNS):
+        self.db = db
+        self.max_size = max_size
+        self._expires = {} # (namespace, id) -> expires_at
+        self._heap = []    # [(expires_at, (namespace, id))] อาจมีค่าเก่าค้าง ตรวจกับ _expires ก่อนทิ้ง
+        self._dirty = set()
+        self._task = None
+
+    def __len__(self):
+        return len(self._expires)
+
+    async def start(self):
+        rows = await self.db.fetchall("SELECT namespace, key, expires_at FROM cooldowns WHERE expires_at > ?", (time.time(),))
+        for namespace, key, expires_at in rows:
+            self._expires[(namespace, key)] = expires_at
+        self._heap = [(exp, k) for k, exp in self._expires.items()]
+        heapq.heapify(self._heap)
+        self._evict(time.time())
+        self._task = asyncio.create_task(self._snapshot_loop())
+
+    async def close(self):
+        if self._task: self._task.cancel()
+        self._task = None
+        await self.flush()
+
+    def remaining(self, namespace: str, key: int) -> float:
+        """วินาทีที่เหลือของคูลดาวน์ (0 = ใช้ได้)"""
+        now = time.time()
+        self._evict(now)
+        return max(0.0, self._expires.get((namespace, key), 0.0) - now)
+
+    def set(self, namespace: str, key: int, seconds: float):
+        k = (namespace, key)
+        expires_at = time.time() + seconds
+        self._expires[k] = expires_at
+        self._dirty.add(k)
+        heapq.heappush(self._heap, (expires_at, k))
+        self._evict(time.time())
+
+    def clear(self, namespace: str, key: int):
+        k = (namespace, key)
+        if self._expires.pop(k, None) is not None: self._dirty.add(k)
+
+    def _evict(self, now: float):
+        heap = self._heap
+        while heap and (heap[0][0] <= now or len(self._expires) > self.max_size):
+            expires_at, k = heapq.heappop(heap)
+            if self._expires.get(k) == expires_at:
+                del self._expires[k]
+                self._dirty.discard(k)
+        # heap สะสมค่าเก่าจากการ set ทับ: สร้างใหม่เมื่อโตเกินสองเท่าของข้อมูลจริง
+        if len(heap) > 2 * len(self._expires) + 64:
+            self._heap = [(exp, k) for k, exp in self._expires.items()]
+            heapq.heapify(self._heap)
+
+    # --- 💾 Snapshot ---
+    async def flush(self):
+        dirty, self._dirty = self._dirty, set()
+        upserts = [(ns, key, self._expires[(ns, key)]) for ns, key in dirty if (ns, key) in self._expires]
+        deletes = [k for k in dirty if k not in self._expires]
+        now = time.time()
+
+        async def save(db):
+            if upserts:
+                await db.executemany("INSERT INTO cooldowns (namespace, key, expires_at) VALUES (?, ?, ?) ON CONFLICT(namespace, key) DO UPDATE SET expires_at = excluded.expires_at", upserts)
+            if deletes:
+                await db.executemany("DELETE FROM cooldowns WHERE namespace = ? AND key = ?", deletes)
+            await db.execute("DELETE FROM cooldowns WHERE expires_at <= ?", (now,))
+        try: await self.db.write(save)
+        except Exception:
+            self._dirty |= dirty # เขียนไม่สำเร็จ รอบหน้าลองใหม่
+            raise
+
+    async def _snapshot_loop(self):
+        while True:
+            await asyncio.sleep(SNAPSHOT_INTERVAL)
+            try: await self.flush()
+            except Exception as e: print(f"⚠️ Cooldown snapshot failed: {e}")
@@ -0,0 +1,92 @@
+import asyncio
+import contextlib
+import aiosqlite
+from utils import get_db_path
+from services.writer import WriteQueue
+
+# --- ⚙️ การตั้งค่า ---
+READ_POOL_SIZE = 3
+STATEMENT_CACHE_SIZE = 256 # sqlite3 cache prepared statement ต่อ connection
+
+# PRAGMA ที่ตั้งให้ทุก connection (WAL ให้ reader อ่านได้ระหว่างที่ writer เขียน)
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA mmap_size=67108864",
+)
+
+class Database:
+    """Connection กลางของบอท: writer actor 1 ตัว (WriteQueue) + reader pool ที่เปิดค้างไว้ตลอด"""
+
+    def __init__(self, path: str = None, pool_size: int = READ_POOL_SIZE):
+        self.path = path or get_db_path()
+        self.pool_size = pool_size
+        self._readers: asyncio.Queue = asyncio.Queue()
+        self._connections = []
+        self.writer: WriteQueue = None
+
+    async def _open(self, **kwargs) -> aiosqlite.Connection:
+        conn = await aiosqlite.connect(self.path, cached_statements=STATEMENT_CACHE_SIZE, **kwargs)
+        conn.row_factory = aiosqlite.Row
+        for pragma in PRAGMAS:
+            await conn.execute(pragma)
+        # อุ่นเครื่อง: ให้ thread ของ connection พร้อมก่อนมี event แรกเข้ามา
+        async with conn.execute("SELECT 1") as c: await c.fetchone()
+        self._connections.append(conn)
+        return conn
+
+    async def connect(self):
+        # writer คุม BEGIN/COMMIT เอง (isolation_level=None) เพื่อทำ group commit
+        self.writer = WriteQueue(await self._open(isolation_level=None))
+        self.writer.start()
+        for _ in range(self.pool_size):
+            self._readers.put_nowait(await self._open())
+
+    async def close(self):
+        if self.writer: await self.writer.stop()
+        for conn in self._connections:
+            try: await conn.close()
+            except: pass
+        self._connections.clear()
+        self.writer = None
+
+    # --- 📖 อ่าน ---
+    @contextlib.asynccontextmanager
+    async def read(self):
+        conn = await self._readers.get()
+        try:
+            yield conn
+        finally:
+            self._readers.put_nowait(conn)
+
+    async def fetchone(self, sql: str, params=()):
+        async with self.read() as conn:
+            async with conn.execute(sql, params) as c:
+                return await c.fetchone()
+
+    async def fetchall(self, sql: str, params=()):
+        async with self.read() as conn:
+            async with conn.execute(sql, params) as c:
+                return await c.fetchall()
+
+    async def fetchval(self, sql: str, params=(), default=None):
+        row = await self.fetchone(sql, params)
+        return row[0] if row and row[0] is not None else default
+
+    # --- ✍️ เขียน ---
+    async def write(self, job, *args):
+        """ส่ง job(conn, *args) เข้าคิวของ writer แล้วรอผลหลัง commit (job ที่ error จะถูก rollback เฉพาะตัว)"""
+        return await self.writer.submit(job, *args)
+
+    async def maintenance(self, job, *args):
+        """รัน job(conn, *args) บน write connection นอก transaction (VACUUM, ATTACH/DETACH, PRAGMA บางตัว)"""
+        return await self.writer.submit(job, *args, transaction=False)
+
+    async def execute(self, sql: str, params=()):
+        async def job(conn):
+            async with conn.execute(sql, params) as c:
+                return c.rowcount
+        return await self.write(job)
@@ -0,0 +1,60 @@
+import asyncio
+import csv
+import datetime
+import gzip
+import json
+import os
+import sqlite3
+import tempfile
+
+# --- ⚙️ การตั้งค่า ---
+EXPORT_FETCH_SIZE = 1000 # แถวต่อการดึงจาก cursor หนึ่งครั้ง
+EXPORT_TABLES = {
+    'transactions': ('id', 'timestamp', 'type', 'source_id', 'target_id', 'amount'),
+    'sales_history': ('id', 'timestamp', 'user_id', 'user_name', 'item_name', 'price', 'quantity', 'shop_name'),
+    'rp_rewards': ('message_id', 'timestamp', 'user_id', 'amount'),
+}
+EXPORT_FORMATS = ('csv', 'jsonl')
+
+def _rows(db_path: str, table: str, start: str, end: str):
+    """อ่านทีละ EXPORT_FETCH_SIZE แถวจาก connection แบบอ่านอย่างเดียวของตัวเอง (ไม่แย่ง reader pool ของบอท)"""
+    columns = EXPORT_TABLES[table]
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        cursor = conn.execute(f"SELECT {', '.join(columns)} FROM {table} WHERE timestamp >= ? AND timestamp < ? ORDER BY timestamp", (start, end))
+        while True:
+            rows = cursor.fetchmany(EXPORT_FETCH_SIZE)
+            if not rows: return
+            yield from rows
+    finally:
+        conn.close()
+
+def _write(db_path: str, table: str, fmt: str, start: str, end: str, out_path: str) -> int:
+    columns = EXPORT_TABLES[table]
+    count = 0
+    with gzip.open(out_path, 'wt', encoding='utf-8', newline='') as f:
+        if fmt == 'csv':
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            for row in _rows(db_path, table, start, end):
+                writer.writerow(row)
+                count += 1
+        else:
+            for row in _rows(db_path, table, start, end):
+                f.write(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + "\n")
+                count += 1
+    return count
+
+async def export_table(db_path: str, table: str, fmt: str, start: datetime.date, end: datetime.date):
+    """เขียนแถวช่วง [start, end] (รวมวัน end) เป็นไฟล์ .gz ชั่วคราวใน thread แยก คืน (path, จำนวนแถว)
+    ผู้เรียกต้องลบไฟล์เองหลังส่งเสร็จ
+    """
+    if table not in EXPORT_TABLES or fmt not in EXPORT_FORMATS: raise ValueError(f"unsupported export: {table}.{fmt}")
+    fd, out_path = tempfile.mkstemp(prefix=f"{table}_", suffix=f".{fmt}.gz")
+    os.close(fd)
+    try:
+        count = await asyncio.to_thread(_write, db_path, table, fmt, start.isoformat(), (end + datetime.timedelta(days=1)).isoformat(), out_path)
+    except Exception:
+        os.remove(out_path)
+        raise
+    return out_path, count
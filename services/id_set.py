@@ -0,0 +1,30 @@
+from array import array
+from bisect import bisect_left
+
+class IdSet:
+    """เซ็ตของ Discord ID (snowflake) แบบเรียงใน array ขนาด 8 ไบต์/ตัว
+    ใช้ตอบ "ID นี้อยู่ในเซ็ตไหม" โดยไม่ต้องถาม SQLite (กินที่น้อยกว่า set() ของ Python ~8 เท่า)
+    """
+
+    def __init__(self, ids=()):
+        self._ids = array('q', sorted(set(ids)))
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, value: int) -> bool:
+        ids = self._ids
+        i = bisect_left(ids, value)
+        return i < len(ids) and ids[i] == value
+
+    def add(self, value: int):
+        ids = self._ids
+        i = bisect_left(ids, value)
+        # snowflake ใหม่มักมากกว่าตัวท้ายสุด จึงแทบทุกครั้งเป็นการต่อท้าย
+        if i == len(ids): ids.append(value)
+        elif ids[i] != value: ids.insert(i, value)
+
+    def discard(self, value: int):
+        ids = self._ids
+        i = bisect_left(ids, value)
+        if i < len(ids) and ids[i] == value: del ids[i]
@@ -0,0 +1,84 @@
+import time
+import unicodedata
+
+# --- ⚙️ การตั้งค่า ---
+ITEM_INDEX_TTL = 600 # วินาที: ผู้ใช้ที่ไม่ได้พิมพ์ค้นหานานเกินนี้จะถูกล้างออกจาก memory
+SWEEP_INTERVAL = 60
+
+THAI_TONE_MARKS = range(0x0E47, 0x0E4D) # ็ ่ ้ ๊ ๋ ์
+
+def normalize(text: str) -> str:
+    """ตัวพิมพ์เล็ก/ใหญ่และวรรณยุกต์ไม่มีผล: 'Élixir' == 'elixir', 'น้ำ' == 'นำ'"""
+    out = []
+    for ch in unicodedata.normalize('NFKD', text.casefold()):
+        if unicodedata.category(ch) == 'Mn':
+            # ตัด accent ของอักษรอื่น/วรรณยุกต์ไทย แต่เก็บสระบน-ล่างของไทยไว้ (เป็นส่วนของคำ)
+            if not ('\u0e00' <= ch <= '\u0e7f') or ord(ch) in THAI_TONE_MARKS: continue
+        out.append(ch)
+    return ''.join(out)
+
+class ItemIndex:
+    """ดัชนีชื่อไอเทมในกระเป๋าต่อผู้ใช้ (ใน memory) สำหรับ autocomplete
+    โหลดจาก inventory ครั้งแรกที่ผู้ใช้พิมพ์ แล้วอัปเดตตามการซื้อ/โอนไอเทม
+    """
+
+    def __init__(self, db, ttl: float = ITEM_INDEX_TTL):
+        self.db = db
+        self.ttl = ttl
+        self._users = {} # user_id -> [expires_at, {item_name: normalized}]
+        self._loading = {} # user_id -> token ของการโหลดที่กำลังรอ (ถูกลบเมื่อกระเป๋าเปลี่ยนระหว่างโหลด)
+        self._next_sweep = 0.0
+
+    async def _entry(self, user_id: int):
+        now = time.monotonic()
+        if now >= self._next_sweep: self._sweep(now)
+
+        entry = self._users.get(user_id)
+        if not entry or entry[0] < now:
+            token = object()
+            self._loading[user_id] = token
+            rows = await self.db.fetchall("SELECT item_name FROM inventory WHERE user_id = ?", (user_id,))
+            names = {r[0]: normalize(r[0]) for r in rows}
+            # ซื้อ/โอนที่ commit ระหว่างรอ DB อาจไม่อยู่ในผลที่อ่านได้ ใช้ตอบครั้งนี้แต่ไม่เก็บ (ครั้งหน้าโหลดใหม่)
+            if self._loading.get(user_id) is not token: return names
+            del self._loading[user_id]
+            entry = self._users[user_id] = [0.0, names]
+        entry[0] = now + self.ttl
+        return entry[1]
+
+    def _sweep(self, now: float):
+        for uid in [uid for uid, entry in self._users.items() if entry[0] < now]:
+            del self._users[uid]
+        self._next_sweep = now + SWEEP_INTERVAL
+
+    async def search(self, user_id: int, current: str, limit: int = 25):
+        names = await self._entry(user_id)
+        query = normalize(current.strip())
+        if not query: return sorted(names)[:limit]
+
+        prefix, contains = [], []
+        for name, norm in names.items():
+            if norm.startswith(query): prefix.append(name)
+            elif query in norm: contains.append(name)
+        return (sorted(prefix) + sorted(contains))[:limit]
+
+    # --- 🔄 อัปเดตหลัง commit (เฉพาะผู้ใช้ที่โหลดไว้แล้ว) ---
+    def add(self, user_id: int, item_name: str):
+        self._loading.pop(user_id, None)
+        entry = self._users.get(user_id)
+        if entry: entry[1][item_name] = normalize(item_name)
+
+    def discard(self, user_id: int, item_name: str):
+        self._loading.pop(user_id, None)
+        entry = self._users.get(user_id)
+        if entry: entry[1].pop(item_name, None)
+
+    def drop_item(self, item_name: str):
+        """สินค้าถูกลบออกจากร้าน (และจากกระเป๋าทุกคน)"""
+        self._loading.clear()
+        for entry in self._users.values():
+            entry[1].pop(item_name, None)
+
+    def invalidate(self, user_id: int):
+        self._loading.pop(user_id, None)
+        self._users.pop(user_id, None)
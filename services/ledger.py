@@ -0,0 +1,142 @@
+import datetime
+import json
+from services.balance_cache import BalanceCache
+
+SYSTEM_ID = 0 # ใช้แทน "ระบบ" ใน transactions (source/target ที่ไม่ใช่สมาชิก)
+
+# --- 🧾 คำสั่งระดับ connection (ใช้ภายใน job ของ Database.write ได้โดยตรง) ---
+# ทุกฟังก์ชันคืนยอดเงินใหม่จาก RETURNING และเขียนแถว transactions ใน transaction เดียวกัน
+# (tx_type=None = ไม่ลงแถว transactions เช่นรางวัล RP ที่มีตาราง rp_rewards เป็นบันทึกอยู่แล้ว)
+
+async def record_in(conn, tx_type: str, source_id: int, target_id: int, amount: int):
+    if tx_type is None: return
+    await conn.execute("INSERT INTO transactions (timestamp, type, source_id, target_id, amount) VALUES (?, ?, ?, ?, ?)",
+                       (datetime.datetime.utcnow().isoformat(), tx_type, source_id, target_id, amount))
+
+async def credit_in(conn, user_id: int, amount: int, tx_type: str, source_id: int = SYSTEM_ID) -> int:
+    async with conn.execute("INSERT INTO royals (user_id, balance) VALUES (?, ?) ON CONFLICT(user_id) DO UPDATE SET balance = balance + excluded.balance RETURNING balance",
+                            (user_id, amount)) as c:
+        bal = (await c.fetchone())[0]
+    await record_in(conn, tx_type, source_id, user_id, amount)
+    return bal
+
+async def credit_many_in(conn, payouts, tx_type: str, source_id: int = SYSTEM_ID) -> dict:
+    """เพิ่มเงินให้หลายคน [(user_id, amount)] ด้วย executemany คืน {user_id: ยอดใหม่}"""
+    payouts = list(payouts)
+    if not payouts: return {}
+    await conn.executemany("INSERT INTO royals (user_id, balance) VALUES (?, ?) ON CONFLICT(user_id) DO UPDATE SET balance = balance + excluded.balance", payouts)
+    if tx_type is not None:
+        ts = datetime.datetime.utcnow().isoformat()
+        await conn.executemany("INSERT INTO transactions (timestamp, type, source_id, target_id, amount) VALUES (?, ?, ?, ?, ?)",
+                               [(ts, tx_type, source_id, uid, amount) for uid, amount in payouts])
+    # executemany ใช้ RETURNING ไม่ได้ จึงอ่านยอดใหม่ทั้งหมดด้วย query เดียว
+    async with conn.execute("SELECT user_id, balance FROM royals WHERE user_id IN (SELECT value FROM json_each(?))",
+                            (json.dumps([uid for uid, _ in payouts]),)) as c:
+        return {uid: bal for uid, bal in await c.fetchall()}
+
+async def debit_in(conn, user_id: int, amount: int, tx_type: str, source_id: int = None, target_id: int = SYSTEM_ID):
+    """หักเงินแบบมีเงื่อนไข (balance >= amount) คืน None ถ้าเงินไม่พอ"""
+    async with conn.execute("UPDATE royals SET balance = balance - ? WHERE user_id = ? AND balance >= ? RETURNING balance",
+                            (amount, user_id, amount)) as c:
+        row = await c.fetchone()
+    if row: bal = row[0]
+    elif amount <= 0: bal = 0 # ยังไม่มีบัญชีแต่ไม่ต้องจ่ายอะไร
+    else: return None
+    await record_in(conn, tx_type, user_id if source_id is None else source_id, target_id, amount)
+    return bal
+
+async def debit_many_in(conn, debits, tx_type: str, source_id: int = None, target_id: int = SYSTEM_ID):
+    """หักเงินหลายคน [(user_id, amount)] เฉพาะคนที่เงินพอ คืน ({user_id: ยอดใหม่}, [user_id ที่เงินไม่พอ])
+    source_id/target_id ที่เป็น None = ตัวผู้ถูกหักเอง (เหมือน debit_in)
+    อ่านยอดแล้วค่อยหักได้อย่างปลอดภัยเพราะอยู่ใน BEGIN IMMEDIATE ของ writer ตัวเดียว
+    """
+    debits = list(debits)
+    if not debits: return {}, []
+    async with conn.execute("SELECT user_id, balance FROM royals WHERE user_id IN (SELECT value FROM json_each(?))",
+                            (json.dumps([uid for uid, _ in debits]),)) as c:
+        current = {uid: bal for uid, bal in await c.fetchall()}
+
+    charged, short = [], []
+    for uid, amount in debits:
+        bal = current.get(uid, 0)
+        if bal >= amount:
+            current[uid] = bal - amount
+            charged.append((uid, amount))
+        else: short.append(uid)
+
+    await conn.executemany("UPDATE royals SET balance = balance - ? WHERE user_id = ?", [(amount, uid) for uid, amount in charged])
+    if tx_type is not None:
+        ts = datetime.datetime.utcnow().isoformat()
+        await conn.executemany("INSERT INTO transactions (timestamp, type, source_id, target_id, amount) VALUES (?, ?, ?, ?, ?)",
+                               [(ts, tx_type, uid if source_id is None else source_id, uid if target_id is None else target_id, amount) for uid, amount in charged])
+    return {uid: current[uid] for uid, _ in charged}, short
+
+async def transfer_in(conn, sender_id: int, receiver_id: int, amount: int, tx_type: str = 'TRANSFER'):
+    """โอนเงินระหว่างสมาชิก คืน (ยอดผู้โอน, ยอดผู้รับ) หรือ None ถ้าเงินไม่พอ"""
+    async with conn.execute("UPDATE royals SET balance = balance - ? WHERE user_id = ? AND balance >= ? RETURNING balance",
+                            (amount, sender_id, amount)) as c:
+        row = await c.fetchone()
+    if not row: return None
+    async with conn.execute("INSERT INTO royals (user_id, balance) VALUES (?, ?) ON CONFLICT(user_id) DO UPDATE SET balance = balance + excluded.balance RETURNING balance",
+                            (receiver_id, amount)) as c:
+        receiver_bal = (await c.fetchone())[0]
+    await record_in(conn, tx_type, sender_id, receiver_id, amount)
+    return row[0], receiver_bal
+
+async def reset_in(conn, user_id: int, tx_type: str, source_id: int = SYSTEM_ID) -> int:
+    await conn.execute("UPDATE royals SET balance = 0 WHERE user_id = ?", (user_id,))
+    await record_in(conn, tx_type, source_id, user_id, 0)
+    return 0
+
+class Ledger:
+    """จุดเดียวสำหรับทุกคำสั่งที่ขยับเงิน: แต่ละ method = 1 write job = 1 transaction
+    และอัปเดต BalanceCache ทันทีหลัง commit (job อื่นที่แตะ royals เองต้องเรียก remember/forget)
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.cache = BalanceCache(db)
+
+    async def credit(self, user_id: int, amount: int, tx_type: str, source_id: int = SYSTEM_ID) -> int:
+        bal = await self.db.write(credit_in, user_id, amount, tx_type, source_id)
+        self.cache.set(user_id, bal)
+        return bal
+
+    async def credit_many(self, payouts, tx_type: str, source_id: int = SYSTEM_ID) -> dict:
+        """จ่ายหลายคนใน transaction เดียว (เช่นรางวัลปาร์ตี้, แจกเงินทั้งยศ) คืน {user_id: ยอดใหม่}"""
+        balances = await self.db.write(credit_many_in, payouts, tx_type, source_id)
+        for uid, bal in balances.items(): self.cache.set(uid, bal)
+        return balances
+
+    async def debit(self, user_id: int, amount: int, tx_type: str, source_id: int = None, target_id: int = SYSTEM_ID):
+        bal = await self.db.write(debit_in, user_id, amount, tx_type, source_id, target_id)
+        if bal is not None: self.cache.set(user_id, bal)
+        return bal
+
+    async def debit_many(self, debits, tx_type: str, source_id: int = None, target_id: int = SYSTEM_ID):
+        balances, short = await self.db.write(debit_many_in, debits, tx_type, source_id, target_id)
+        for uid, bal in balances.items(): self.cache.set(uid, bal)
+        return balances, short
+
+    async def transfer(self, sender_id: int, receiver_id: int, amount: int, tx_type: str = 'TRANSFER'):
+        result = await self.db.write(transfer_in, sender_id, receiver_id, amount, tx_type)
+        if result:
+            self.cache.set(sender_id, result[0])
+            self.cache.set(receiver_id, result[1])
+        return result
+
+    async def reset(self, user_id: int, tx_type: str, source_id: int = SYSTEM_ID) -> int:
+        bal = await self.db.write(reset_in, user_id, tx_type, source_id)
+        self.cache.set(user_id, bal)
+        return bal
+
+    async def balance(self, user_id: int) -> int:
+        return await self.cache.get(user_id)
+
+    def remember(self, user_id: int, balance: int):
+        """ใช้หลัง job ที่หัก/เพิ่มเงินผ่าน *_in เองสำเร็จ (เช่นซื้อของ, รางวัล RP)"""
+        self.cache.set(user_id, balance)
+
+    def forget(self, user_id: int):
+        """ใช้หลังลบ/แก้ royals นอก Ledger (เช่นลบโปรไฟล์, สมาชิกออก)"""
+        self.cache.invalidate(user_id)
@@ -0,0 +1,207 @@
+import datetime
+
+# --- 🗂️ Schema Migrations ---
+# เพิ่ม migration ใหม่ต่อท้ายรายการเสมอ (ห้ามแก้ของเดิมที่ deploy ไปแล้ว)
+# แต่ละรายการ: (version, ชื่อ, [คำสั่ง SQL]) และรันใน transaction เดียวกัน
+
+MIGRATIONS = [
+    (1, "initial schema", [
+        "CREATE TABLE IF NOT EXISTS royals (user_id INTEGER PRIMARY KEY, balance INTEGER DEFAULT 0)",
+        """
+        CREATE TABLE IF NOT EXISTS transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TEXT NOT NULL,
+            type TEXT NOT NULL,
+            source_id INTEGER NOT NULL,
+            target_id INTEGER NOT NULL,
+            amount INTEGER NOT NULL
+        )
+        """,
+        "CREATE TABLE IF NOT EXISTS shop_items (id INTEGER PRIMARY KEY, name TEXT UNIQUE, price INTEGER, description TEXT, image_url TEXT, stock INTEGER DEFAULT -1, shop_name TEXT DEFAULT 'General Store')",
+        "CREATE TABLE IF NOT EXISTS inventory (id INTEGER PRIMARY KEY, user_id INTEGER, item_name TEXT, amount INTEGER DEFAULT 1)",
+        "CREATE TABLE IF NOT EXISTS sales_history (id INTEGER PRIMARY KEY, user_id INTEGER, user_name TEXT, item_name TEXT, price INTEGER, timestamp TEXT, shop_name TEXT DEFAULT 'Unknown')",
+        "CREATE TABLE IF NOT EXISTS active_displays (id INTEGER PRIMARY KEY, item_name TEXT, channel_id INTEGER, message_id INTEGER)",
+        "CREATE TABLE IF NOT EXISTS rp_rewards (message_id INTEGER PRIMARY KEY, user_id INTEGER, amount INTEGER, timestamp TEXT)",
+        """
+        CREATE TABLE IF NOT EXISTS activity_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            activity_type TEXT,
+            timestamp TEXT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS student_profiles (
+            user_id INTEGER PRIMARY KEY,
+            profile_name TEXT,
+            grade TEXT,
+            faceclaim TEXT,
+            image_url TEXT,
+            affiliation_role TEXT,
+            logo_url TEXT,
+            thread_id INTEGER,
+            wallet_thread_id INTEGER,
+            inventory_thread_id INTEGER,
+            trading_thread_id INTEGER,
+            desk_thread_id INTEGER,
+            id_card_url TEXT
+        )
+        """,
+        "CREATE TABLE IF NOT EXISTS applications (user_id INTEGER PRIMARY KEY, application_text TEXT, submitted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)",
+        "CREATE TABLE IF NOT EXISTS user_data (user_id INTEGER PRIMARY KEY, is_approved BOOLEAN DEFAULT 0)",
+    ]),
+    (2, "lookup indexes", [
+        # รวมแถว inventory ที่ซ้ำกัน (user_id, item_name) ก่อนสร้าง UNIQUE index
+        """
+        UPDATE inventory SET amount = (
+            SELECT SUM(i2.amount) FROM inventory i2
+            WHERE i2.user_id = inventory.user_id AND i2.item_name = inventory.item_name
+        )
+        WHERE id IN (SELECT MIN(id) FROM inventory GROUP BY user_id, item_name HAVING COUNT(*) > 1)
+        """,
+        "DELETE FROM inventory WHERE id NOT IN (SELECT MIN(id) FROM inventory GROUP BY user_id, item_name)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_inventory_user_item ON inventory (user_id, item_name)",
+        "CREATE INDEX IF NOT EXISTS idx_inventory_item ON inventory (item_name)",
+        "CREATE INDEX IF NOT EXISTS idx_rp_rewards_user ON rp_rewards (user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_activity_logs_user_type_ts ON activity_logs (user_id, activity_type, timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_transactions_source ON transactions (source_id)",
+        "CREATE INDEX IF NOT EXISTS idx_transactions_target ON transactions (target_id)",
+        "CREATE INDEX IF NOT EXISTS idx_sales_history_user ON sales_history (user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_active_displays_item ON active_displays (item_name)",
+        "CREATE INDEX IF NOT EXISTS idx_shop_items_shop ON shop_items (shop_name)",
+    ]),
+    (3, "notification outbox", [
+        """
+        CREATE TABLE IF NOT EXISTS notification_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            channel_id INTEGER,
+            embed TEXT NOT NULL,
+            created_at TEXT NOT NULL
+        )
+        """,
+    ]),
+    (4, "rp stats aggregate", [
+        """
+        CREATE TABLE IF NOT EXISTS rp_stats (
+            user_id INTEGER PRIMARY KEY,
+            post_count INTEGER NOT NULL DEFAULT 0,
+            total_earned INTEGER NOT NULL DEFAULT 0,
+            last_post TEXT
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_rp_stats_rank ON rp_stats (post_count DESC, total_earned DESC)",
+        "INSERT OR REPLACE INTO rp_stats (user_id, post_count, total_earned, last_post) SELECT user_id, COUNT(*), COALESCE(SUM(amount), 0), MAX(timestamp) FROM rp_rewards GROUP BY user_id",
+    ]),
+    (5, "weekly activity quota", [
+        """
+        CREATE TABLE IF NOT EXISTS activity_quota (
+            user_id INTEGER NOT NULL,
+            activity_type TEXT NOT NULL,
+            week_start TEXT NOT NULL,
+            used INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, activity_type, week_start)
+        ) WITHOUT ROWID
+        """,
+        # week_start = วันจันทร์ของสัปดาห์ (YYYY-MM-DD) ตรงกับ SchoolActivities._get_week_start
+        """
+        INSERT OR REPLACE INTO activity_quota (user_id, activity_type, week_start, used)
+        SELECT user_id, activity_type, date(timestamp, 'weekday 0', '-6 days'), COUNT(*)
+        FROM activity_logs GROUP BY 1, 2, 3
+        """,
+    ]),
+    (6, "cooldowns", [
+        """
+        CREATE TABLE IF NOT EXISTS cooldowns (
+            namespace TEXT NOT NULL,
+            key INTEGER NOT NULL,
+            expires_at REAL NOT NULL,
+            PRIMARY KEY (namespace, key)
+        ) WITHOUT ROWID
+        """,
+    ]),
+    (7, "monthly archive summaries", [
+        """
+        CREATE TABLE IF NOT EXISTS transactions_monthly (
+            month TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            type TEXT NOT NULL,
+            sent_count INTEGER NOT NULL DEFAULT 0,
+            sent_amount INTEGER NOT NULL DEFAULT 0,
+            received_count INTEGER NOT NULL DEFAULT 0,
+            received_amount INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (month, user_id, type)
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS sales_monthly (
+            month TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            item_name TEXT NOT NULL,
+            purchases INTEGER NOT NULL DEFAULT 0,
+            spent INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (month, user_id, item_name)
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS rp_rewards_monthly (
+            month TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            posts INTEGER NOT NULL DEFAULT 0,
+            earned INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (month, user_id)
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS activity_monthly (
+            month TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            activity_type TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (month, user_id, activity_type)
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_transactions_timestamp ON transactions (timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_sales_history_timestamp ON sales_history (timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_rp_rewards_timestamp ON rp_rewards (timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_activity_logs_timestamp ON activity_logs (timestamp)",
+    ]),
+    (8, "thread provisioning", [
+        """
+        CREATE TABLE IF NOT EXISTS thread_provisioning (
+            user_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            thread_id INTEGER NOT NULL,
+            stage TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            PRIMARY KEY (user_id, kind)
+        ) WITHOUT ROWID
+        """,
+    ]),
+    (9, "sales quantity", [
+        "ALTER TABLE sales_history ADD COLUMN quantity INTEGER NOT NULL DEFAULT 1",
+    ]),
+    (10, "statement type indexes", [
+        # /statement ที่กรอง type: range scan ตาม (ฝั่ง, type) แล้วเรียงด้วย rowid ได้เลย
+        "CREATE INDEX IF NOT EXISTS idx_transactions_source_type ON transactions (source_id, type)",
+        "CREATE INDEX IF NOT EXISTS idx_transactions_target_type ON transactions (target_id, type)",
+    ]),
+]
+
+async def run_migrations(db):
+    """รัน migration ที่ยังไม่เคยรัน (เรียกครั้งเดียวตอนบอทเริ่ม) คืนค่ารายการ version ที่เพิ่งรัน"""
+    await db.execute("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER PRIMARY KEY, name TEXT NOT NULL, applied_at TEXT NOT NULL)")
+    current = await db.fetchval("SELECT MAX(version) FROM schema_version", default=0)
+
+    applied = []
+    for version, name, statements in MIGRATIONS:
+        if version <= current: continue
+
+        async def apply(conn, version=version, name=name, statements=statements):
+            for sql in statements:
+                await conn.execute(sql)
+            await conn.execute("INSERT INTO schema_version (version, name, applied_at) VALUES (?, ?, ?)",
+                               (version, name, datetime.datetime.utcnow().isoformat()))
+        await db.write(apply)
+        applied.append(version)
+    return applied
@@ -0,0 +1,137 @@
+import asyncio
+import datetime
+import json
+import aiohttp
+import discord
+
+# --- ⚙️ การตั้งค่า ---
+COALESCE_WINDOW = 1.5      # รอใบเสร็จที่ตามมาติด ๆ กี่วินาทีก่อนส่ง (เพื่อรวมเป็นข้อความเดียว)
+CHANNEL_MIN_INTERVAL = 1.0 # เว้นระยะขั้นต่ำระหว่างข้อความในห้องเดียวกัน (Discord จำกัด ~5 ข้อความ/5 วินาที/ห้อง)
+MAX_MERGED_RECEIPTS = 10   # ใบเสร็จสูงสุดต่อ 1 embed ที่รวมแล้ว (กันเกินลิมิต 6000 ตัวอักษร)
+MAX_ATTEMPTS = 3
+RETRY_DELAY = 5.0
+MAX_RETRY_DELAY = 300.0
+# error ฝั่งเครือข่าย (เน็ตหลุด/reconnect): ลองใหม่ไปเรื่อย ๆ ไม่นับเป็นการส่งไม่สำเร็จ
+TRANSIENT_ERRORS = (aiohttp.ClientError, OSError, asyncio.TimeoutError)
+
+class NotificationOutbox:
+    """คิวส่งใบเสร็จเบื้องหลัง: Cog แค่ enqueue แล้วตอบ interaction ได้ทันที
+    ใบเสร็จถูกบันทึกลงตาราง notification_outbox ก่อน (ไม่หายตอนรีสตาร์ท)
+    worker แยกตามปลายทาง จะรวมใบเสร็จที่ค้างอยู่ในเธรดเดียวกันเป็น embed เดียวหลายฟิลด์
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.db = bot.db
+        self._pending = {} # dest -> [(row_id, embed)]
+        self._tasks = {}   # dest -> asyncio.Task
+        self._attempts = {}
+        self.stats = {'queued': 0, 'messages': 0, 'receipts': 0, 'dropped': 0}
+
+    async def start(self):
+        """โหลดใบเสร็จที่ยังส่งไม่ถึงจากรอบก่อนแล้วเริ่มส่งต่อ"""
+        rows = await self.db.fetchall("SELECT id, user_id, channel_id, embed FROM notification_outbox ORDER BY id")
+        for row_id, user_id, channel_id, data in rows:
+            dest = ('channel', channel_id) if channel_id else ('dm', user_id)
+            self._push(dest, row_id, discord.Embed.from_dict(json.loads(data)))
+
+    async def close(self):
+        for task in self._tasks.values(): task.cancel()
+        self._tasks.clear()
+
+    async def enqueue(self, user, embed: discord.Embed, dm_fallback: bool = False):
+        """ส่ง embed ไปเธรด Wallet ของ user (หรือ DM ถ้า dm_fallback และไม่มีเธรด)"""
+        channel_id = self.bot.threads.wallet(user.id)
+        if not channel_id and not dm_fallback: return
+        dest = ('channel', channel_id) if channel_id else ('dm', user.id)
+
+        async def insert(db):
+            async with db.execute("INSERT INTO notification_outbox (user_id, channel_id, embed, created_at) VALUES (?, ?, ?, ?) RETURNING id",
+                                  (user.id, channel_id, json.dumps(embed.to_dict(), ensure_ascii=False), datetime.datetime.utcnow().isoformat())) as c:
+                return (await c.fetchone())[0]
+        self._push(dest, await self.db.write(insert), embed)
+
+    async def enqueue_many(self, items, dm_fallback: bool = False):
+        """เหมือน enqueue แต่หลายใบ [(user, embed)] บันทึกลง DB ใน write job เดียว"""
+        rows = []
+        for user, embed in items:
+            channel_id = self.bot.threads.wallet(user.id)
+            if not channel_id and not dm_fallback: continue
+            dest = ('channel', channel_id) if channel_id else ('dm', user.id)
+            rows.append((dest, user.id, channel_id, embed))
+        if not rows: return
+
+        created_at = datetime.datetime.utcnow().isoformat()
+        async def insert(db):
+            ids = []
+            for _, user_id, channel_id, embed in rows:
+                async with db.execute("INSERT INTO notification_outbox (user_id, channel_id, embed, created_at) VALUES (?, ?, ?, ?) RETURNING id",
+                                      (user_id, channel_id, json.dumps(embed.to_dict(), ensure_ascii=False), created_at)) as c:
+                    ids.append((await c.fetchone())[0])
+            return ids
+        for (dest, _, _, embed), row_id in zip(rows, await self.db.write(insert)):
+            self._push(dest, row_id, embed)
+
+    def _push(self, dest, row_id, embed):
+        self._pending.setdefault(dest, []).append((row_id, embed))
+        self.stats['queued'] += 1
+        if dest not in self._tasks:
+            self._tasks[dest] = asyncio.create_task(self._drain(dest))
+
+    async def _drain(self, dest):
+        try:
+            await self.bot.wait_until_ready()
+            while self._pending.get(dest):
+                await asyncio.sleep(COALESCE_WINDOW)
+                items = self._pending[dest][:MAX_MERGED_RECEIPTS]
+                del self._pending[dest][:len(items)]
+                try: await self._deliver(dest, items)
+                except Exception as e:
+                    # เช่นลบแถวใน DB ไม่สำเร็จ: แถวยังอยู่ จะถูกส่งใหม่ตอนรีสตาร์ท worker ของปลายทางนี้ทำงานต่อ
+                    print(f"⚠️ Outbox {dest}: {e!r}")
+                    await asyncio.sleep(RETRY_DELAY)
+                await asyncio.sleep(CHANNEL_MIN_INTERVAL)
+        finally:
+            self._tasks.pop(dest, None)
+            if not self._pending.get(dest): self._pending.pop(dest, None)
+
+    async def _resolve(self, dest):
+        kind, target_id = dest
+        if kind == 'dm':
+            return self.bot.get_user(target_id) or await self.bot.fetch_user(target_id)
+        return self.bot.get_channel(target_id) or await self.bot.fetch_channel(target_id)
+
+    async def _deliver(self, dest, items):
+        ids = [row_id for row_id, _ in items]
+        try:
+            embed = items[0][1] if len(items) == 1 else _merge([e for _, e in items])
+            target = await self._resolve(dest)
+            await target.send(embed=embed)
+        except (discord.Forbidden, discord.NotFound):
+            # ส่งไม่ได้ถาวร (เธรดถูกลบ/ปิด DM) ทิ้งไป
+            self.stats['dropped'] += len(items)
+        except Exception as e:
+            if not isinstance(e, discord.HTTPException): print(f"⚠️ Outbox {dest}: {e!r}")
+            attempt = self._attempts.get(dest, 0) + 1
+            if attempt < MAX_ATTEMPTS or isinstance(e, TRANSIENT_ERRORS):
+                self._attempts[dest] = attempt
+                self._pending.setdefault(dest, [])[:0] = items # ใส่กลับหัวคิว ลองใหม่รอบหน้า
+                retry_after = getattr(e, 'retry_after', None) or min(RETRY_DELAY * 2 ** (attempt - 1), MAX_RETRY_DELAY)
+                await asyncio.sleep(retry_after)
+                return
+            self.stats['dropped'] += len(items)
+        else:
+            self.stats['messages'] += 1
+            self.stats['receipts'] += len(items)
+        self._attempts.pop(dest, None)
+        await self.db.execute(f"DELETE FROM notification_outbox WHERE id IN ({','.join('?' * len(ids))})", ids)
+
+def _merge(embeds):
+    """รวมใบเสร็จหลายใบเป็น embed เดียว (1 ใบ = 1 ฟิลด์)"""
+    merged = discord.Embed(title=f"🧾 รายการล่าสุด ({len(embeds)})", color=embeds[-1].color, timestamp=datetime.datetime.now())
+    for e in embeds:
+        lines = [e.description] if e.description else []
+        lines += [f"**{f.name}:** {f.value}" for f in e.fields]
+        value = "\n".join(lines) or "-"
+        merged.add_field(name=(e.title or "รายการ")[:256], value=value[:500], inline=False)
+    return merged
@@ -0,0 +1,72 @@
+import asyncio
+import datetime
+import discord
+
+# --- ⚙️ การตั้งค่า ---
+# จำนวนคำขอ Discord API ที่ยิงพร้อมกันได้ระหว่างสร้างเธรด
+# การรอ rate limit จริงใช้ของ discord.py (อ่าน X-RateLimit-* header แยกตาม bucket แล้วรอเอง) ไม่ต้อง sleep เอง
+PROVISION_CONCURRENCY = 4
+
+async def clear_provisioning_in(conn, user_id: int):
+    """เรียกใน job เดียวกับที่บันทึกโปรไฟล์: เธรดถูกบันทึกลงโปรไฟล์แล้ว ไม่ต้องจำไว้อีก"""
+    await conn.execute("DELETE FROM thread_provisioning WHERE user_id = ?", (user_id,))
+
+class ThreadProvisioner:
+    """สร้างเธรดส่วนตัวหลายห้องพร้อมกัน (จำกัดจำนวนคำขอพร้อมกันด้วย semaphore)
+    ทุกเธรดที่สร้างแล้วถูกจดลง thread_provisioning ทันที ถ้าล้มกลางทาง รอบถัดไปจะนำเธรดเดิมกลับมาใช้
+    (ไม่เหลือเธรดกำพร้า) ส่วน student_profiles ให้ผู้เรียกเขียนทีเดียวหลังได้เธรดครบ
+    """
+
+    def __init__(self, db, concurrency: int = PROVISION_CONCURRENCY):
+        self.db = db
+        self._limit = asyncio.Semaphore(concurrency)
+
+    async def _call(self, coro):
+        async with self._limit:
+            return await coro
+
+    async def _existing(self, guild: discord.Guild, thread_id: int):
+        thread = guild.get_thread(thread_id)
+        if thread: return thread
+        try: return await self._call(guild.fetch_channel(thread_id))
+        except (discord.NotFound, discord.Forbidden): return None
+
+    async def _record(self, user_id: int, kind: str, thread_id: int, stage: str):
+        await self.db.execute("""
+            INSERT INTO thread_provisioning (user_id, kind, thread_id, stage, created_at) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(user_id, kind) DO UPDATE SET thread_id = excluded.thread_id, stage = excluded.stage
+        """, (user_id, kind, thread_id, stage, datetime.datetime.utcnow().isoformat()))
+
+    async def _provision_one(self, channel, member, kind: str, name: str, welcome: str, previous):
+        thread, stage = None, None
+        if previous:
+            thread = await self._existing(channel.guild, previous['thread_id'])
+            stage = previous['stage']
+        if not thread:
+            thread = await self._call(channel.create_thread(name=name, type=discord.ChannelType.private_thread))
+            stage = 'created'
+            await self._record(member.id, kind, thread.id, stage)
+
+        if stage != 'ready':
+            await self._call(thread.add_user(member))
+            if welcome: await self._call(thread.send(welcome))
+            await self._record(member.id, kind, thread.id, 'ready')
+        return thread
+
+    async def provision(self, channel, member, specs):
+        """specs = [(kind, ชื่อเธรด, ข้อความต้อนรับหรือ None)] คืน {kind: thread}
+        ถ้ามีห้องไหนล้ม จะรอห้องอื่นจบ (และจดลง DB) ก่อนโยน error ตัวแรกออกไป
+        """
+        rows = await self.db.fetchall("SELECT kind, thread_id, stage FROM thread_provisioning WHERE user_id = ?", (member.id,))
+        previous = {row['kind']: row for row in rows}
+
+        results = await asyncio.gather(*[
+            self._provision_one(channel, member, kind, name, welcome, previous.get(kind))
+            for kind, name, welcome in specs
+        ], return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException): raise result
+        return {spec[0]: thread for spec, thread in zip(specs, results)}
+
+    async def archive(self, threads):
+        await asyncio.gather(*[self._call(t.edit(archived=True)) for t in threads], return_exceptions=True)
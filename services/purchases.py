@@ -0,0 +1,190 @@
+import asyncio
+import collections
+import datetime
+import time
+from services.ledger import debit_in
+
+# --- ⚙️ การตั้งค่า ---
+MAX_PURCHASE_BATCH = 64 # คำสั่งซื้อสูงสุดของสินค้าเดียวกันต่อ 1 write job
+MAX_LINE_QUANTITY = 20  # จำนวนสูงสุดต่อรายการในตะกร้า
+RATE_WINDOW = 60.0      # วินาที: อัตราขายคิดจาก commit ในช่วงนี้
+RATE_MIN_SPAN = 5.0     # วินาที: commit ในหน้าต่างห่างกันไม่ถึงนี้ ยังไม่คำนวณอัตรา
+RATE_MAX_SAMPLES = 1024 # commit ล่าสุดที่เก็บไว้ต่อสินค้า
+
+# จองสต็อกแบบมีเงื่อนไข (-1 = ไม่จำกัด) ไม่มีแถวคืน = ของไม่พอ
+RESERVE_STOCK = """
+    UPDATE shop_items SET stock = CASE WHEN stock = -1 THEN -1 ELSE stock - :qty END
+    WHERE name = :name AND (stock = -1 OR stock >= :qty)
+    RETURNING price, stock, image_url, shop_name
+"""
+
+async def purchase_in(conn, user_id: int, user_name: str, name: str, quantity: int = 1):
+    """ซื้อสินค้า 1 รายการภายใน job: จองสต็อก + หักเงิน + เข้ากระเป๋า + ลง sales_history
+    คืน (price, image_url, ยอดเงินใหม่, สต็อกใหม่, shop_name) หรือข้อความ error (ถ้า error จะไม่มีอะไรถูกเขียน)
+    """
+    await conn.execute("SAVEPOINT purchase")
+    try:
+        async with conn.execute(RESERVE_STOCK, {'qty': quantity, 'name': name}) as c:
+            row = await c.fetchone()
+        if not row:
+            async with conn.execute("SELECT 1 FROM shop_items WHERE name = ?", (name,)) as c:
+                error = "สินค้าหมด" if await c.fetchone() else "สินค้าหมด/ถูกลบ"
+        else:
+            price, stock, img, shop_name = row
+            bal = await debit_in(conn, user_id, price * quantity, None)
+            if bal is None: error = "เงินไม่พอ"
+            else:
+                await conn.execute("INSERT INTO inventory (user_id, item_name, amount) VALUES (?, ?, ?) ON CONFLICT(user_id, item_name) DO UPDATE SET amount = amount + excluded.amount",
+                                   (user_id, name, quantity))
+                await conn.execute("INSERT INTO sales_history (user_id, user_name, item_name, price, quantity, timestamp, shop_name) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                   (user_id, user_name, name, price, quantity, datetime.datetime.now().isoformat(), shop_name))
+                await conn.execute("RELEASE purchase")
+                return price, img, bal, stock, shop_name
+    except Exception:
+        await conn.execute("ROLLBACK TO purchase")
+        await conn.execute("RELEASE purchase")
+        raise
+    # ไม่สำเร็จ: คืนสต็อกที่จองไว้ (ถ้ามี)
+    await conn.execute("ROLLBACK TO purchase")
+    await conn.execute("RELEASE purchase")
+    return error
+
+async def checkout_in(conn, user_id: int, user_name: str, lines):
+    """ซื้อหลายรายการ [(name, quantity)] แบบทั้งหมดหรือไม่เลย
+    คืน ([(name, quantity, price, image_url, สต็อกใหม่)], ยอดเงินสุดท้าย, None)
+    หรือ ([], None, (name, ข้อความ error)) ของรายการแรกที่ซื้อไม่ได้
+    """
+    for name, quantity in lines:
+        if not isinstance(quantity, int) or not 1 <= quantity <= MAX_LINE_QUANTITY:
+            return [], None, (name, f"จำนวนต้องอยู่ระหว่าง 1-{MAX_LINE_QUANTITY}")
+
+    await conn.execute("SAVEPOINT checkout")
+    bought, bal = [], None
+    for name, quantity in lines:
+        result = await purchase_in(conn, user_id, user_name, name, quantity)
+        if isinstance(result, str):
+            await conn.execute("ROLLBACK TO checkout")
+            await conn.execute("RELEASE checkout")
+            return [], None, (name, result)
+        price, img, bal, stock, _ = result
+        bought.append((name, quantity, price, img, stock))
+    await conn.execute("RELEASE checkout")
+    return bought, bal, None
+
+class PurchaseEngine:
+    """คิวซื้อแยกตามสินค้า: คำสั่งซื้อสินค้าเดียวกันเข้าแถวตามลำดับ แล้วถูกเขียนรวมเป็น job เดียว
+    ของหมดแล้ว (ตาม catalog ที่อัปเดตหลัง commit) ปฏิเสธทันทีโดยไม่แตะ DB
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.db = bot.db
+        self._pending = {} # item_name -> [(user_id, user_name, quantity, future)]
+        self._tasks = {}   # item_name -> asyncio.Task
+        self._stats = {}
+        self._commits = {} # item_name -> deque[(monotonic, จำนวนที่ขายได้ใน commit นั้น)]
+
+    def _item_stats(self, name: str):
+        stats = self._stats.get(name)
+        if not stats:
+            stats = self._stats[name] = {'requests': 0, 'sold': 0, 'sold_out': 0, 'no_funds': 0, 'batches': 0}
+        return stats
+
+    def _reject(self, name: str, error: str):
+        self._item_stats(name)['no_funds' if error == "เงินไม่พอ" else 'sold_out'] += 1
+
+    def _committed(self, name: str, sold: int):
+        stats = self._item_stats(name)
+        stats['batches'] += 1
+        stats['sold'] += sold
+        if sold:
+            commits = self._commits.setdefault(name, collections.deque(maxlen=RATE_MAX_SAMPLES))
+            commits.append((time.monotonic(), sold))
+
+    async def buy(self, user, name: str, quantity: int = 1):
+        """คืน (price, image_url, ยอดเงินใหม่, สต็อกใหม่, shop_name) หรือข้อความ error"""
+        # นับสถิติเฉพาะสินค้าที่มีอยู่จริง (ชื่อเก่าจาก select ที่ค้าง/พิมพ์ผิดจะไม่กลายเป็น key ถาวร)
+        item = self.bot.catalog.get(name)
+        if not item: return "สินค้าหมด/ถูกลบ"
+        stats = self._item_stats(name)
+        stats['requests'] += 1
+        if item['stock'] != -1 and item['stock'] < quantity:
+            stats['sold_out'] += 1
+            return "สินค้าหมด"
+
+        fut = asyncio.get_running_loop().create_future()
+        self._pending.setdefault(name, []).append((user.id, user.display_name, quantity, fut))
+        if name not in self._tasks:
+            self._tasks[name] = asyncio.create_task(self._drain(name))
+        return await fut
+
+    async def _drain(self, name: str):
+        try:
+            while self._pending.get(name):
+                batch = self._pending[name][:MAX_PURCHASE_BATCH]
+                del self._pending[name][:len(batch)]
+                await self._run_batch(name, batch)
+        finally:
+            self._tasks.pop(name, None)
+            if not self._pending.get(name): self._pending.pop(name, None)
+
+    async def _run_batch(self, name: str, batch):
+        async def purchase_all(db):
+            return [await purchase_in(db, uid, uname, name, qty) for uid, uname, qty, _ in batch]
+        try: results = await self.db.write(purchase_all)
+        except Exception as e:
+            for *_, fut in batch:
+                if not fut.done(): fut.set_exception(e)
+            return
+
+        sold = 0
+        for (uid, _, qty, fut), result in zip(batch, results):
+            if isinstance(result, str): self._reject(name, result)
+            else:
+                sold += qty
+                self.bot.ledger.remember(uid, result[2])
+                self.bot.catalog.set_stock(name, result[3])
+                self.bot.item_index.add(uid, name)
+            if not fut.done(): fut.set_result(result)
+        self._committed(name, sold)
+
+    async def checkout(self, user, cart: dict):
+        """ซื้อทั้งตะกร้า {name: quantity} ใน transaction เดียว คืน (รายการที่ซื้อ, ยอดเงินใหม่) หรือข้อความ error"""
+        for name, quantity in cart.items():
+            if not 1 <= quantity <= MAX_LINE_QUANTITY: return f"{name}: จำนวนต้องอยู่ระหว่าง 1-{MAX_LINE_QUANTITY}"
+        for name in cart:
+            if not self.bot.catalog.get(name): return f"{name}: สินค้าหมด/ถูกลบ"
+        for name in cart: self._item_stats(name)['requests'] += 1
+        for name, quantity in cart.items():
+            item = self.bot.catalog.get(name)
+            if item['stock'] != -1 and item['stock'] < quantity:
+                self._reject(name, "สินค้าหมด")
+                return f"{name}: สินค้าเหลือไม่พอ ({item['stock']} ชิ้น)"
+
+        bought, bal, failure = await self.db.write(checkout_in, user.id, user.display_name, list(cart.items()))
+        if failure:
+            name, error = failure
+            self._reject(name, error)
+            return f"{name}: {error}"
+        self.bot.ledger.remember(user.id, bal)
+        for name, quantity, _, _, stock in bought:
+            self._committed(name, quantity)
+            self.bot.catalog.set_stock(name, stock)
+            self.bot.item_index.add(user.id, name)
+        return bought, bal
+
+    def _rate(self, name: str, now: float):
+        """ชิ้น/วินาที จาก commit ใน RATE_WINDOW ล่าสุด (None ถ้าข้อมูลยังไม่พอ)"""
+        commits = self._commits.get(name)
+        if not commits: return None
+        while commits and commits[0][0] < now - RATE_WINDOW: commits.popleft()
+        if len(commits) < 2: return None
+        span = commits[-1][0] - commits[0][0]
+        if span < RATE_MIN_SPAN: return None
+        # ยอดของ commit แรกเกิดก่อนจุดเริ่มช่วงเวลา จึงไม่นับ
+        return sum(sold for _, sold in list(commits)[1:]) / span
+
+    def stats(self):
+        """สถิติต่อสินค้า: จำนวนคำขอ/ขายได้/ปฏิเสธ และอัตราขายล่าสุด (per_second เป็น None ถ้ายังวัดไม่ได้)"""
+        now = time.monotonic()
+        return {name: {**s, 'per_second': self._rate(name, now)} for name, s in self._stats.items()}
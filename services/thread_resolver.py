@@ -0,0 +1,30 @@
+# คอลัมน์เธรดส่วนตัวใน student_profiles
+THREAD_COLUMNS = ('thread_id', 'wallet_thread_id', 'inventory_thread_id', 'trading_thread_id', 'desk_thread_id')
+
+class ThreadResolver:
+    """แผนที่ user_id -> thread IDs ใน memory (sync กับตาราง student_profiles)
+    แทนการอ่าน profiles.json ทุกครั้งที่ต้องส่งใบเสร็จ
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._threads = {}
+
+    async def load(self):
+        rows = await self.db.fetchall(f"SELECT user_id, {', '.join(THREAD_COLUMNS)} FROM student_profiles")
+        self._threads = {row[0]: dict(zip(THREAD_COLUMNS, row[1:])) for row in rows}
+
+    async def refresh(self, user_id: int):
+        """อ่านแถวของคนเดียวใหม่ (เรียกหลังสร้าง/แก้โปรไฟล์)"""
+        row = await self.db.fetchone(f"SELECT {', '.join(THREAD_COLUMNS)} FROM student_profiles WHERE user_id = ?", (user_id,))
+        if row: self._threads[user_id] = dict(zip(THREAD_COLUMNS, row))
+        else: self._threads.pop(user_id, None)
+
+    def invalidate(self, user_id: int):
+        self._threads.pop(user_id, None)
+
+    def get(self, user_id: int, column: str = 'wallet_thread_id'):
+        return self._threads.get(user_id, {}).get(column)
+
+    def wallet(self, user_id: int):
+        return self.get(user_id, 'wallet_thread_id')
@@ -0,0 +1,134 @@
+import asyncio
+import aiosqlite
+
+# --- ⚙️ การตั้งค่า ---
+MAX_BATCH_JOBS = 64       # จำนวน job สูงสุดต่อการ commit หนึ่งครั้ง
+MAX_BATCH_LATENCY = 0.002 # รอ job เพิ่มได้นานสุดกี่วินาทีก่อน commit
+
+class WriteQueue:
+    """Writer actor: ถือ write connection ตัวเดียว รับ job จากทุก Cog ผ่าน asyncio.Queue
+    แล้ว commit เป็นกลุ่ม (group commit) โดยแต่ละ job แยก SAVEPOINT ของตัวเอง
+    job ที่ error จะถูก rollback เฉพาะตัว ไม่ลากคนอื่นในกลุ่มไปด้วย
+
+    ⚠️ ห้ามเรียก Database.write ซ้อนภายใน job (จะรอตัวเองจน deadlock)
+    """
+
+    def __init__(self, conn: aiosqlite.Connection, max_jobs: int = MAX_BATCH_JOBS, max_latency: float = MAX_BATCH_LATENCY):
+        self.conn = conn
+        self.max_jobs = max_jobs
+        self.max_latency = max_latency
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.stats = {'jobs': 0, 'failed': 0, 'commits': 0}
+        self._task = None
+        self._closing = False
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if not self._task: return
+        # ปิดรับ job ใหม่ก่อน แล้วใส่ sentinel ต่อท้าย: job ที่เข้าคิวมาก่อนหน้าถูกเขียนจนหมดแล้วค่อยหยุด
+        self._closing = True
+        self.queue.put_nowait(None)
+        await self._task
+        self._task = None
+
+    async def submit(self, job, *args, transaction: bool = True):
+        """transaction=False: รัน job ตามลำดับคิวแต่อยู่นอก transaction (สำหรับ VACUUM/ATTACH ที่ห้ามรันใน BEGIN)"""
+        if self._closing: raise RuntimeError("WriteQueue is closed")
+        fut = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((job, args, fut, transaction))
+        return await fut
+
+    async def _collect(self, first):
+        batch = [first]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_latency
+        while len(batch) < self.max_jobs:
+            try:
+                item = self.queue.get_nowait()
+            except asyncio.QueueEmpty:
+                timeout = deadline - loop.time()
+                if timeout <= 0: break
+                try: item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError: break
+            batch.append(item)
+            if item is None: break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect(await self.queue.get())
+            try:
+                await self._process(batch)
+            except Exception as e:
+                # error นอก job (เช่น connection มีปัญหา): ล้มเฉพาะกลุ่มนี้ writer ยังทำงานต่อ
+                print(f"⚠️ Writer batch failed ({len(batch)} jobs): {e}")
+                if self.conn.in_transaction:
+                    try: await self.conn.execute("ROLLBACK")
+                    except Exception: pass
+                for item in batch:
+                    if item and not item[2].done(): item[2].set_exception(e)
+            if batch[-1] is None: return # sentinel ถูกหยิบออกมาแล้ว = ไม่มี job ค้างหลังจากนี้
+
+    async def _process(self, batch):
+        jobs = []
+        for item in batch:
+            if item is None: continue
+            if item[3]:
+                jobs.append(item)
+                continue
+            # job นอก transaction: commit กลุ่มก่อนหน้าให้จบก่อน แล้วรันตัวนี้ลำพัง
+            if jobs: await self._run_batch(jobs)
+            jobs = []
+            await self._run_bare(item)
+        if jobs: await self._run_batch(jobs)
+
+    async def _run_bare(self, item):
+        job, args, fut, _ = item
+        if fut.cancelled(): return
+        try: result = await job(self.conn, *args)
+        except Exception as e:
+            self.stats['failed'] += 1
+            fut.set_exception(e)
+            return
+        self.stats['jobs'] += 1
+        fut.set_result(result)
+
+    async def _run_batch(self, jobs):
+        done = []
+        try:
+            await self.conn.execute("BEGIN IMMEDIATE")
+        except Exception as e:
+            for _, _, fut, _ in jobs:
+                if not fut.done(): fut.set_exception(e)
+            return
+
+        for job, args, fut, _ in jobs:
+            if fut.cancelled(): continue
+            await self.conn.execute("SAVEPOINT job")
+            try:
+                result = await job(self.conn, *args)
+            except Exception as e:
+                await self.conn.execute("ROLLBACK TO job")
+                await self.conn.execute("RELEASE job")
+                self.stats['failed'] += 1
+                fut.set_exception(e)
+                continue
+            await self.conn.execute("RELEASE job")
+            done.append((fut, result))
+
+        try:
+            await self.conn.execute("COMMIT")
+        except Exception as e:
+            try: await self.conn.execute("ROLLBACK")
+            except: pass
+            for fut, _ in done:
+                if not fut.done(): fut.set_exception(e)
+            return
+
+        self.stats['jobs'] += len(done)
+        self.stats['commits'] += 1
+        # ส่งผลลัพธ์คืนหลัง commit แล้วเท่านั้น (ผู้เรียกเห็นข้อมูลที่ลงดิสก์จริง)
+        for fut, result in done:
+            if not fut.done(): fut.set_result(result)
@@ -4,6 +4,16 @@ import os
 from dotenv import load_dotenv
 from aiohttp import web
 import asyncio
+from services.database import Database
+from services.migrations import run_migrations
+from services.ledger import Ledger
+from services.thread_resolver import ThreadResolver
+from services.outbox import NotificationOutbox
+from services.catalog import ShopCatalog
+from services.item_index import ItemIndex
+from services.cooldowns import CooldownStore
+from services.provisioning import ThreadProvisioner
+from services.purchases import PurchaseEngine
 
 # โหลด Token
 load_dotenv()
@@ -19,6 +29,25 @@ class RoyalBot(commands.Bot):
         super().__init__(command_prefix='!', intents=intents, help_command=None)
 
     async def setup_hook(self):
+        # เปิด Database กลาง (ทุก Cog ใช้ผ่าน self.bot.db)
+        self.db = Database()
+        await self.db.connect()
+        applied = await run_migrations(self.db)
+        if applied: print(f"🧱 Applied schema migrations: {applied}")
+        self.ledger = Ledger(self.db)
+        self.threads = ThreadResolver(self.db)
+        await self.threads.load()
+        self.catalog = ShopCatalog(self.db)
+        await self.catalog.load()
+        self.item_index = ItemIndex(self.db)
+        self.purchases = PurchaseEngine(self)
+        self.cooldowns = CooldownStore(self.db)
+        await self.cooldowns.start()
+        self.provisioner = ThreadProvisioner(self.db)
+        self.outbox = NotificationOutbox(self)
+        await self.outbox.start()
+        print(f"🗄️ Database ready: {self.db.path}")
+
         # โหลดไฟล์ระบบต่างๆ (Cogs)
         extensions = [
             'cogs.roles',
@@ -56,6 +85,12 @@ class RoyalBot(commands.Bot):
         await site.start()
         print(f"🌐 Web server started on port {port} (Render Ready)")
 
+    async def close(self):
+        await super().close()
+        if getattr(self, 'outbox', None): await self.outbox.close()
+        if getattr(self, 'cooldowns', None): await self.cooldowns.close()
+        if getattr(self, 'db', None): await self.db.close()
+
     async def on_ready(self):
         print(f'✨ Logged in as {self.user} (ID: {self.user.id})')
         print('🏰 The Royal Academy System is Online!')